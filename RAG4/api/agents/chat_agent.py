@@ -1,35 +1,124 @@
 from .base_agent import BaseAgent
 from langchain_utils import get_rag_chain
-from db_utils import get_chat_history, insert_application_logs
+from db_utils import log_writer
+from summarizer import summarizer
+from filters import build_where
+from chroma_utils import SITE_SEARCHERS
+import asyncio
+import time
 import uuid
 
 class ChatAgent(BaseAgent):
     def __init__(self):
         super().__init__("ChatAgent")
-    
+
     def process(self, query_input):
         self.log(f"Processing: {query_input.question[:50]}...")
-        
+
         session_id = query_input.session_id or str(uuid.uuid4())
-        chat_history = get_chat_history(session_id)
-        
+        chat_history, turn = summarizer.load_history(session_id, query_input.model.value)
+
         rag_chain = get_rag_chain(query_input.model.value)
         result = rag_chain.invoke({
             "input": query_input.question,
-            "chat_history": chat_history
+            "chat_history": chat_history,
+            "session_id": session_id,
+            "turn": turn,
+            "where": build_where(query_input.scope, SITE_SEARCHERS)
         })
-        
+
         answer = result["answer"]
-        
-        # Логируем источники
-        for i, doc in enumerate(result.get("context", [])):
-            self.log(f"Source {i+1}: {doc.page_content[:100]}...")
-        
-        insert_application_logs(session_id, query_input.question, answer, query_input.model.value)
+        self._log_sources(result.get("context", []))
+
+        self._save_turn(session_id, query_input.question, answer, query_input.model.value)
         self.log(f"Response generated for session {session_id}")
-        
+
         return {
             "answer": answer,
             "session_id": session_id,
             "model": query_input.model
-        }
\ No newline at end of file
+        }
+
+    async def aprocess(self, query_input):
+        """Тот же process, но без блокировки event loop"""
+        self.log(f"Processing: {query_input.question[:50]}...")
+
+        session_id = query_input.session_id or str(uuid.uuid4())
+        chat_history, turn = await asyncio.to_thread(summarizer.load_history, session_id, query_input.model.value)
+
+        rag_chain = get_rag_chain(query_input.model.value)
+        result = await rag_chain.ainvoke({
+            "input": query_input.question,
+            "chat_history": chat_history,
+            "session_id": session_id,
+            "turn": turn,
+            "where": build_where(query_input.scope, SITE_SEARCHERS)
+        })
+
+        answer = result["answer"]
+        self._log_sources(result.get("context", []))
+
+        self._save_turn(session_id, query_input.question, answer, query_input.model.value)
+        self.log(f"Response generated for session {session_id}")
+
+        return {
+            "answer": answer,
+            "session_id": session_id,
+            "model": query_input.model
+        }
+
+    async def astream(self, query_input):
+        """Отдает ответ по токенам: события start, token, done (или error)"""
+        self.log(f"Streaming: {query_input.question[:50]}...")
+
+        session_id = query_input.session_id or str(uuid.uuid4())
+        model = query_input.model.value
+        yield {"type": "start", "session_id": session_id, "model": model}
+
+        started = time.perf_counter()
+        first_token_at = None
+        answer_parts = []
+        context = []
+
+        try:
+            chat_history, turn = await asyncio.to_thread(summarizer.load_history, session_id, model)
+            rag_chain = get_rag_chain(model)
+            async for chunk in rag_chain.astream({
+                "input": query_input.question,
+                "chat_history": chat_history,
+                "session_id": session_id,
+                "turn": turn,
+                "where": build_where(query_input.scope, SITE_SEARCHERS)
+            }):
+                if "context" in chunk:
+                    context = chunk["context"]
+                token = chunk.get("answer")
+                if not token:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    self.log(f"Time to first token: {first_token_at - started:.3f}s")
+                answer_parts.append(token)
+                yield {"type": "token", "content": token}
+        except Exception as e:
+            self.log(f"Streaming failed for session {session_id}: {e}")
+            yield {"type": "error", "detail": str(e)}
+            return
+
+        answer = "".join(answer_parts)
+        self._log_sources(context)
+
+        self._save_turn(session_id, query_input.question, answer, model)
+        self.log(f"Response streamed for session {session_id} in {time.perf_counter() - started:.3f}s")
+
+        yield {"type": "done", "answer": answer, "session_id": session_id, "model": model}
+
+    def _save_turn(self, session_id, question, answer, model):
+        # Запись уходит в фоновый поток и не задерживает ответ; сводка обновляется после фиксации
+        log_writer.submit(session_id, question, answer, model,
+                          on_commit=lambda: summarizer.schedule(session_id, model))
+
+    def _log_sources(self, documents):
+        # Логируем источники
+        for i, doc in enumerate(documents):
+            self.log(f"Source {i+1}: {doc.page_content[:100]}...")
@@ -14,20 +14,42 @@ class AgentCoordinator:
     def process_chat(self, query_input: QueryInput) -> QueryResponse:
         result = self.chat_agent.process(query_input)
         return QueryResponse(**result)
+
+    async def aprocess_chat(self, query_input: QueryInput) -> QueryResponse:
+        result = await self.chat_agent.aprocess(query_input)
+        return QueryResponse(**result)
+
+    def stream_chat(self, query_input: QueryInput):
+        return self.chat_agent.astream(query_input)
     
     def upload_document(self, file):
         return self.document_agent.process({"action": "upload", "file": file})
     
+    def get_job(self, job_id):
+        return self.document_agent.get_job(job_id)
+    
+    async def aget_job(self, job_id):
+        return await self.document_agent.aget_job(job_id)
+
     def delete_document(self, file_id):
         return self.document_agent.process({"action": "delete", "file_id": file_id})
     
     def list_documents(self):
         return self.document_agent.process({"action": "list"})
     
-    def get_chat_sessions(self):
-        return self.session_agent.get_chat_sessions()
+    async def alist_documents(self):
+        return await self.document_agent.aget_documents_list()
+
+    def get_chat_sessions(self, limit, cursor=None):
+        return self.session_agent.get_chat_sessions(limit, cursor)
     
-    def get_chat_history(self, session_id):
-        return self.session_agent.get_chat_history(session_id)
+    def get_chat_history(self, session_id, limit, cursor=None):
+        return self.session_agent.get_chat_history(session_id, limit, cursor)
+
+    async def aget_chat_sessions(self, limit, cursor=None):
+        return await self.session_agent.aget_chat_sessions(limit, cursor)
+
+    async def aget_chat_history(self, session_id, limit, cursor=None):
+        return await self.session_agent.aget_chat_history(session_id, limit, cursor)
 
 coordinator = AgentCoordinator()
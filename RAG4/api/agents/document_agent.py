@@ -1,11 +1,45 @@
 # api/agents/document_agent.py
 from .base_agent import BaseAgent
-from db_utils import insert_document_record, delete_document_record, get_all_documents
-from chroma_utils import index_document_to_chroma, delete_doc_from_chroma
+from db_utils import (insert_document_record, delete_document_record, get_all_documents, insert_ingest_job, get_ingest_job,
+                      find_document_by_hash, aget_all_documents, aget_ingest_job)
+from chroma_utils import delete_doc_from_chroma
+from job_queue import ingest_pool
+from config import UPLOAD_DIR, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES
+import hashlib
 import os
-import shutil
+import uuid
 from fastapi import UploadFile
 
+class UploadTooLarge(Exception):
+    pass
+
+def save_upload(file: UploadFile, path: str):
+    """Пишет загрузку в path блоками, считая sha256 и проверяя лимит размера на лету.
+
+    Файл появляется под итоговым именем только целиком (через .part и os.replace),
+    поэтому воркер индексации никогда не увидит недописанный файл.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+
+    digest = hashlib.sha256()
+    size = 0
+    part_path = f"{path}.part"
+    try:
+        with open(part_path, "wb") as buffer:
+            while chunk := file.file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return size, digest.hexdigest()
+
 class DocumentAgent(BaseAgent):
     def __init__(self):
         super().__init__("DocumentAgent")
@@ -31,25 +65,38 @@ class DocumentAgent(BaseAgent):
         if file_extension not in allowed_extensions:
             return {"error": f"Unsupported file type: {file_extension}"}
 
-        temp_file_path = f"temp_{file.filename}"
+        job_id = uuid.uuid4().hex
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        upload_path = os.path.join(UPLOAD_DIR, f"{job_id}{file_extension}")
+
+        size, file_hash = save_upload(file, upload_path)
+        self.log(f"Saved {file.filename}: {size} bytes, sha256 {file_hash[:12]}")
+
+        # Тот же файл уже загружен: повторная индексация ничего не добавит
+        existing = find_document_by_hash(file_hash)
+        if existing:
+            os.remove(upload_path)
+            self.log(f"{file.filename} is already uploaded as document {existing['file_id']}")
+            return {"message": "File already uploaded", "job_id": existing["job_id"],
+                    "file_id": existing["file_id"], "duplicate": True}
 
         try:
-            with open(temp_file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            file_id = insert_document_record(file.filename, file_hash)
+            insert_ingest_job(job_id, file.filename, upload_path, file_id)
+        except Exception:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            raise
 
-            file_id = insert_document_record(file.filename)
-            success = index_document_to_chroma(temp_file_path, file_id)
+        ingest_pool.notify()
+        self.log(f"Queued {file.filename} as job {job_id}")
+        return {"message": "File accepted for indexing", "job_id": job_id, "file_id": file_id}
+    
+    def get_job(self, job_id: str):
+        return get_ingest_job(job_id)
 
-            if success:
-                self.log(f"Successfully uploaded: {file.filename}")
-                return {"message": f"File uploaded and indexed", "file_id": file_id}
-            else:
-                delete_document_record(file_id)
-                return {"error": f"Failed to index {file.filename}"}
-                
-        finally:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+    async def aget_job(self, job_id: str):
+        return await aget_ingest_job(job_id)
     
     def process_deletion(self, file_id: int):
         self.log(f"Deleting document: {file_id}")
@@ -67,3 +114,8 @@ class DocumentAgent(BaseAgent):
     def get_documents_list(self):
         self.log("Fetching documents list")
         return get_all_documents()
+
+    async def aget_documents_list(self):
+        self.log("Fetching documents list")
+        return await aget_all_documents()
+
@@ -13,13 +13,16 @@ class ForumAgent(BaseAgent):
         
         if not selected_sites:
             self.log("No sites selected")
-            return True
+            return {}
         
-        success = search_forum(question, selected_sites)
+        report = search_forum(question, selected_sites, data.get("session_id"))
         
-        if success:
+        for site, site_report in report.items():
+            self.log(f"{site}: {site_report['status']}")
+        
+        if any(site_report["success"] for site_report in report.values()):
             self.log(f"Successfully searched {len(selected_sites)} sites")
         else:
             self.log("Forum search failed")
             
-        return success
\ No newline at end of file
+        return report
@@ -1,5 +1,5 @@
 from .base_agent import BaseAgent
-from db_utils import get_all_chat_sessions, get_chat_history
+from db_utils import get_chat_sessions_page, get_chat_history_page, aget_chat_sessions_page, aget_chat_history_page
 
 class SessionAgent(BaseAgent):
     def __init__(self):
@@ -10,16 +10,24 @@ class SessionAgent(BaseAgent):
         action = data.get("action")
         
         if action == "get_sessions":
-            return self.get_chat_sessions()
+            return self.get_chat_sessions(data["limit"], data.get("cursor"))
         elif action == "get_history":
-            return self.get_chat_history(data["session_id"])
+            return self.get_chat_history(data["session_id"], data["limit"], data.get("cursor"))
         else:
             return {"error": f"Unknown action: {action}"}
     
-    def get_chat_sessions(self):
+    def get_chat_sessions(self, limit, cursor=None):
         self.log("Fetching chat sessions")
-        return get_all_chat_sessions()
+        return get_chat_sessions_page(limit, cursor)
     
-    def get_chat_history(self, session_id):
+    def get_chat_history(self, session_id, limit, cursor=None):
         self.log(f"Fetching history for: {session_id}")
-        return get_chat_history(session_id)
\ No newline at end of file
+        return get_chat_history_page(session_id, limit, cursor)
+
+    async def aget_chat_sessions(self, limit, cursor=None):
+        self.log("Fetching chat sessions")
+        return await aget_chat_sessions_page(limit, cursor)
+
+    async def aget_chat_history(self, session_id, limit, cursor=None):
+        self.log(f"Fetching history for: {session_id}")
+        return await aget_chat_history_page(session_id, limit, cursor)
@@ -0,0 +1,76 @@
+# api/benchmarks/bench_backends.py
+# Запуск из каталога api: python -m benchmarks.bench_backends --vectors 50000 --backends chroma,hnsw,quantized
+# Сравнивает векторные хранилища на одних и тех же данных, чтобы выбрать VECTOR_BACKEND и параметры HNSW
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+import numpy as np
+from langchain_core.documents import Document
+
+from benchmarks.bench_quantized import synthetic_vectors, store_vectors, recall, timed
+from config import VECTOR_HNSW_M, VECTOR_HNSW_EF_CONSTRUCTION, VECTOR_HNSW_EF_SEARCH, QUANTIZED_RESCORE_FACTOR
+from vector_store import create_backend
+
+# Каждый чанк относится к одному из стольких документов: фильтр where берет один из них
+FILTER_FILES = 20
+
+def main():
+    parser = argparse.ArgumentParser(description="Build time, latency, recall@k and size of vector backends")
+    parser.add_argument("--backends", default="chroma,hnsw,quantized")
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--m", type=int, default=VECTOR_HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=VECTOR_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--ef-search", type=int, default=VECTOR_HNSW_EF_SEARCH)
+    parser.add_argument("--rescore-factor", type=int, default=QUANTIZED_RESCORE_FACTOR)
+    parser.add_argument("--store", action="store_true", help="use vectors of the configured vector store")
+    args = parser.parse_args()
+
+    vectors = store_vectors() if args.store else synthetic_vectors(args.vectors, args.dim, args.clusters)
+    count, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(count, args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    ids = [str(i) for i in range(count)]
+    file_ids = np.arange(count) % FILTER_FILES
+    documents = [Document(page_content=f"chunk {i}", metadata={"file_id": int(file_ids[i])}) for i in range(count)]
+    where = {"file_id": 0}
+    print(f"{count} vectors x {dim} dims, {len(queries)} queries, k={args.k}, "
+          f"M={args.m}, ef_construction={args.ef_construction}, ef_search={args.ef_search}")
+
+    # Точный top-k по косинусу - эталон для recall; для фильтра - только среди чанков file_id 0
+    truth = [list(np.argsort(-(vectors @ query))[:args.k].astype(str)) for query in queries]
+    filtered = np.flatnonzero(file_ids == 0)
+    filtered_truth = [list(filtered[np.argsort(-(vectors[filtered] @ query))[:args.k]].astype(str)) for query in queries]
+
+    print(f"{'backend':<12}{'build s':>10}{'p95 ms':>10}{'recall':>10}{'where p95':>11}{'where rec':>11}{'disk MB':>10}")
+    for name in args.backends.split(","):
+        workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+        try:
+            backend = create_backend(name, workdir, None, m=args.m, ef_construction=args.ef_construction,
+                                     ef_search=args.ef_search, rescore_factor=args.rescore_factor)
+            started = time.perf_counter()
+            for start in range(0, count, args.batch):
+                end = start + args.batch
+                backend.upsert(ids[start:end], vectors[start:end], documents[start:end])
+            backend.persist()
+            build = time.perf_counter() - started
+
+            search = lambda q: [doc.id for doc, _ in backend.search(q, args.k)]
+            scoped = lambda q: [doc.id for doc, _ in backend.search(q, args.k, where)]
+            found, p95 = timed(search, queries)
+            found_scoped, scoped_p95 = timed(scoped, queries)
+            print(f"{name:<12}{build:>10.1f}{p95:>10.2f}{recall(found, truth):>10.4f}"
+                  f"{scoped_p95:>11.2f}{recall(found_scoped, filtered_truth):>11.4f}"
+                  f"{backend.size_bytes() / 2**20:>10.1f}")
+        finally:
+            shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# api/benchmarks/bench_chain_registry.py
+# Запуск из каталога api: python -m benchmarks.bench_chain_registry --model llama3.2
+import argparse
+import statistics
+import time
+
+from langchain_ollama import ChatOllama
+
+from config import OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE
+from langchain_utils import build_rag_chain, get_rag_chain
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(timings) * 1000:9.3f} ms   "
+          f"p50 {statistics.median(timings) * 1000:9.3f} ms   p95 {p95 * 1000:9.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request RAG chain construction overhead")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    # Как раньше в get_rag_chain: на каждый запрос новый ChatOllama со своими HTTP-клиентами и новая цепочка.
+    # Сборка не обращается к Ollama, поэтому сервер для замера не нужен
+    def build_per_request():
+        llm = ChatOllama(model=args.model, base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)
+        return build_rag_chain(args.model, llm=llm)
+
+    before = measure(build_per_request, args.iterations)
+    get_rag_chain(args.model)
+    after = measure(lambda: get_rag_chain(args.model), args.iterations)
+
+    report("build per request (before)", before)
+    report("shared registry (after)", after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# api/benchmarks/bench_db.py
+# Запуск из каталога api: python -m benchmarks.bench_db --rows 1000000 --sessions 20000
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+    print(f"{name:<36} mean {statistics.mean(timings) * 1000:9.3f} ms   "
+          f"p50 {statistics.median(timings) * 1000:9.3f} ms   p95 {p95 * 1000:9.3f} ms")
+
+def measure(fn, args_list, threads):
+    def timed(args):
+        started = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(timed, args_list))
+
+def populate(path, rows, sessions):
+    """Таблица application_logs в исходной схеме (без индексов) с rows строками"""
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE application_logs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     session_id TEXT,
+                     user_query TEXT,
+                     gpt_response TEXT,
+                     model TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    rng = random.Random(0)
+    base = time.time() - rows
+    batch = []
+    for i in range(rows):
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(base + i))
+        batch.append((f"session-{rng.randrange(sessions)}", f"question {i}", f"answer {i} " * 8, "llama3.2", created))
+        if len(batch) == 50000:
+            conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at) '
+                             'VALUES (?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at) '
+                         'VALUES (?, ?, ?, ?, ?)', batch)
+    conn.commit()
+    conn.close()
+
+# Прежняя реализация: соединение на вызов, журнал по умолчанию, без индексов
+def old_get_chat_history(path, session_id):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at',
+                        (session_id,)).fetchall()
+    conn.close()
+    return rows
+
+def old_insert_application_logs(path, session_id):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
+                 (session_id, "question", "answer", "llama3.2"))
+    conn.commit()
+    conn.close()
+
+def old_get_all_chat_sessions(path):
+    conn = sqlite3.connect(path, timeout=30)
+    rows = conn.execute('''SELECT session_id, MIN(created_at) as last_message_time, user_query
+                           FROM application_logs GROUP BY session_id ORDER BY last_message_time DESC''').fetchall()
+    conn.close()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history reads/writes on a large application_logs table")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    path = os.path.join(workdir, "rag_app.db")
+    started = time.perf_counter()
+    populate(path, args.rows, args.sessions)
+    print(f"populated {args.rows} rows / {args.sessions} sessions in {time.perf_counter() - started:.1f}s ({path})")
+
+    rng = random.Random(1)
+    reads = [(f"session-{rng.randrange(args.sessions)}",) for _ in range(args.queries)]
+    writes = [(f"session-{rng.randrange(args.sessions)}",) for _ in range(args.queries)]
+
+    before_read = measure(lambda s: old_get_chat_history(path, s), reads, args.threads)
+    before_write = measure(lambda s: old_insert_application_logs(path, s), writes, args.threads)
+    before_sessions = measure(lambda: old_get_all_chat_sessions(path), [()] * 3, 1)
+
+    # db_utils читает путь к базе из окружения при импорте и применяет миграции (WAL, индексы)
+    os.environ["DB_NAME"] = path
+    started = time.perf_counter()
+    import db_utils
+    print(f"migrations applied in {time.perf_counter() - started:.1f}s")
+
+    after_read = measure(db_utils.get_chat_history, reads, args.threads)
+    after_write = measure(lambda s: db_utils.insert_application_logs(s, "question", "answer", "llama3.2"),
+                          writes, args.threads)
+    # Список сессий теперь читается страницами из сводной таблицы chat_sessions
+    after_sessions = measure(lambda: db_utils.get_chat_sessions_page(50), [()] * 3, 1)
+
+    report("get_chat_history (before)", before_read)
+    report("get_chat_history (after)", after_read)
+    report("insert_application_logs (before)", before_write)
+    report("insert_application_logs (after)", after_write)
+    report("get_all_chat_sessions (before)", before_sessions)
+    report("chat sessions first page (after)", after_sessions)
+    print(f"history speedup: {statistics.mean(before_read) / statistics.mean(after_read):.0f}x")
+
+if __name__ == "__main__":
+    main()
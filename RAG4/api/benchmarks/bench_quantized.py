@@ -0,0 +1,116 @@
+# api/benchmarks/bench_quantized.py
+# Запуск из каталога api: python -m benchmarks.bench_quantized --vectors 100000 --k 10
+# С --store берутся векторы из текущего векторного хранилища вместо синтетических
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import hnswlib
+import numpy as np
+
+from quantized_store import QuantizedVectorIndex
+
+def synthetic_vectors(count, dim, clusters, seed=0):
+    """Кластеризованные нормированные векторы: ближе к эмбеддингам текста, чем равномерный шум"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignment = rng.integers(0, clusters, count)
+    vectors = centers[assignment] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def store_vectors():
+    from chroma_utils import vector_store
+    embeddings = []
+    offset = 0
+    while True:
+        batch = vector_store.get(include=["embeddings"], limit=5000, offset=offset)
+        if not batch["ids"]:
+            break
+        embeddings.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        offset += len(batch["ids"])
+    vectors = np.concatenate(embeddings)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def recall(found, truth):
+    return statistics.mean(len(set(f) & set(t)) / len(t) for f, t in zip(found, truth))
+
+def timed(fn, queries):
+    results, timings = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(fn(query))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return results, timings[max(int(len(timings) * 0.95) - 1, 0)] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and memory of the int8 index against float32 HNSW")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    # Параметры HNSW по умолчанию у Chroma
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef-search", type=int, default=100)
+    parser.add_argument("--store", action="store_true")
+    args = parser.parse_args()
+
+    vectors = store_vectors() if args.store else synthetic_vectors(args.vectors, args.dim, args.clusters)
+    count, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(count, args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    ids = [str(i) for i in range(count)]
+    print(f"{count} vectors x {dim} dims, {len(queries)} queries, k={args.k}")
+
+    # Точный top-k по float32 - эталон для recall
+    truth = [list(np.argsort(-(vectors @ query))[:args.k].astype(str)) for query in queries]
+
+    workdir = tempfile.mkdtemp(prefix="bench_quantized_")
+    try:
+        hnsw = hnswlib.Index(space="cosine", dim=dim)
+        hnsw.init_index(max_elements=count, M=args.m, ef_construction=args.ef_construction)
+        started = time.perf_counter()
+        hnsw.add_items(vectors, np.arange(count))
+        hnsw_build = time.perf_counter() - started
+        hnsw.set_ef(max(args.ef_search, args.k))
+        hnsw_path = os.path.join(workdir, "hnsw.bin")
+        hnsw.save_index(hnsw_path)
+        hnsw_found, hnsw_p95 = timed(lambda q: list(hnsw.knn_query(q, k=args.k)[0][0].astype(str)), queries)
+
+        index = QuantizedVectorIndex(os.path.join(workdir, "int8"), rescore_factor=args.rescore_factor)
+        started = time.perf_counter()
+        for start in range(0, count, 10000):
+            index.add(ids[start:start + 10000], vectors[start:start + 10000])
+        # compact снимает запас емкости от удвоения, как после обслуживания хранилища
+        index.compact()
+        int8_build = time.perf_counter() - started
+        coarse_found, coarse_p95 = timed(lambda q: [i for i, _ in index.search(q, args.k, rescore=False)], queries)
+        rescored_found, rescored_p95 = timed(lambda q: [i for i, _ in index.search(q, args.k)], queries)
+        stats = index.stats()
+
+        hnsw_bytes = os.path.getsize(hnsw_path)
+        print(f"{'index':<28}{'recall@k':>10}{'p95 ms':>10}{'RAM MB':>10}{'disk MB':>10}{'build s':>10}")
+        print(f"{'float32 HNSW':<28}{recall(hnsw_found, truth):>10.4f}{hnsw_p95:>10.2f}"
+              f"{hnsw_bytes / 2**20:>10.1f}{hnsw_bytes / 2**20:>10.1f}{hnsw_build:>10.1f}")
+        print(f"{'int8 (no rescoring)':<28}{recall(coarse_found, truth):>10.4f}{coarse_p95:>10.2f}"
+              f"{stats['resident_bytes'] / 2**20:>10.1f}{stats['disk_bytes'] / 2**20:>10.1f}{int8_build:>10.1f}")
+        print(f"{f'int8 + rescore x{args.rescore_factor}':<28}{recall(rescored_found, truth):>10.4f}{rescored_p95:>10.2f}"
+              f"{stats['resident_bytes'] / 2**20:>10.1f}{stats['disk_bytes'] / 2**20:>10.1f}{int8_build:>10.1f}")
+        print(f"RAM reduction vs float32 HNSW: {hnsw_bytes / stats['resident_bytes']:.1f}x, "
+              f"disk: {hnsw_bytes / stats['disk_bytes']:.1f}x")
+        print(f"int8 disk = codes {stats['codes_bytes'] / 2**20:.1f} MB + {index.rescore_dtype.name} rescoring "
+              f"vectors {stats['rescore_bytes'] / 2**20:.1f} MB: the saving is in RAM, on disk only "
+              f"{hnsw_bytes / stats['disk_bytes']:.1f}x")
+        print(f"int8 RAM includes the Python id maps ({(stats['resident_bytes'] - stats['codes_bytes']) / 2**20:.1f} MB); "
+              f"HNSW RAM is the graph file only, without the id maps an application keeps next to it")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# api/browser_pool.py
+from contextlib import contextmanager
+import queue
+import threading
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from config import BROWSER_POOL_SIZE, BROWSER_MAX_USES, BROWSER_PAGE_TIMEOUT
+
+class BrowserPool:
+    """Ограниченный пул долгоживущих headless Chrome, которые выдаются в аренду на один парсинг"""
+
+    def __init__(self, size, max_uses):
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _create_driver(self):
+        options = Options()
+        options.add_argument('--headless')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(BROWSER_PAGE_TIMEOUT)
+        return driver
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Ошибка при закрытии браузера: {e}")
+
+    def _is_alive(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except WebDriverException:
+            return False
+
+    def _take_driver(self):
+        while True:
+            try:
+                driver, uses = self._idle.get_nowait()
+            except queue.Empty:
+                return self._create_driver(), 0
+            if self._is_alive(driver):
+                return driver, uses
+            print("Браузер из пула не отвечает, перезапускаем")
+            self._quit(driver)
+
+    @contextmanager
+    def lease(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Нет свободного браузера в пуле")
+        try:
+            driver, uses = self._take_driver()
+            healthy = True
+            try:
+                yield driver
+            except WebDriverException:
+                healthy = False
+                raise
+            finally:
+                uses += 1
+                if healthy and uses < self.max_uses and not self._closed:
+                    self._idle.put((driver, uses))
+                else:
+                    self._quit(driver)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+def wait_for(driver, css_selector, timeout):
+    """Ждет появления элемента вместо фиксированной паузы; False, если не дождались"""
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, css_selector))
+        )
+        return True
+    except TimeoutException:
+        print(f"Не дождались элемента {css_selector}")
+        return False
+
+browser_pool = BrowserPool(BROWSER_POOL_SIZE, BROWSER_MAX_USES)
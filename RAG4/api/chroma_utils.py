@@ -1,18 +1,63 @@
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredHTMLLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings.sentence_transformer import SentenceTransformerEmbeddings
-from langchain_chroma import Chroma
-from typing import List
+from typing import Iterator, List
 from langchain_core.documents import Document
 from parser import search_stackoverflow, search_reddit, search_habr, search_mailru, search_geekforgeeks
+from config import (FORUM_SEARCH_DEADLINE, FORUM_SITE_TIMEOUT, FORUM_SITE_TIMEOUTS, INDEX_BATCH_SIZE,
+                    EMBEDDING_MODEL, EMBED_BATCH_SIZE, EMBED_WORKERS, EMBED_THREADS_PER_WORKER, EMBED_PARALLEL_MIN,
+                    SESSION_NAMESPACE_TTL, SESSION_NAMESPACE_MAX_CHUNKS, SESSION_GC_INTERVAL,
+                    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, VECTOR_BACKEND, VECTOR_STORE_DIR,
+                    VECTOR_HNSW_M, VECTOR_HNSW_EF_CONSTRUCTION, VECTOR_HNSW_EF_SEARCH, QUANTIZED_RESCORE_FACTOR,
+                    VECTOR_PERSIST_CHUNKS, VECTOR_PERSIST_INTERVAL)
+from embedding_service import EmbeddingService
+from session_store import SessionVectorStore
+from vector_store import create_backend
+from concurrent.futures import ThreadPoolExecutor
+from dedup import SimHashIndex, content_hash, simhash
+from retrieval_cache import bump_collection_version
+from db_utils import insert_document_chunks, get_chunk_sources
+import lexical_index
+import scrape_cache
+import threading
+import time
 
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
 
-embedding_function = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
+embedding_function = EmbeddingService(
+    EMBEDDING_MODEL,
+    batch_size=EMBED_BATCH_SIZE,
+    workers=EMBED_WORKERS,
+    threads_per_worker=EMBED_THREADS_PER_WORKER,
+    parallel_min=EMBED_PARALLEL_MIN,
+)
 
-vectorstore = Chroma(persist_directory="./chroma_db", embedding_function=embedding_function)
+vector_store = create_backend(
+    VECTOR_BACKEND,
+    VECTOR_STORE_DIR,
+    embedding_function,
+    m=VECTOR_HNSW_M,
+    ef_construction=VECTOR_HNSW_EF_CONSTRUCTION,
+    ef_search=VECTOR_HNSW_EF_SEARCH,
+    rescore_factor=QUANTIZED_RESCORE_FACTOR,
+)
 
-def load_and_split_document(file_path: str) -> List[Document]:
+# Все записи в хранилище идут под этой блокировкой, чтобы пересборка индекса не потеряла их
+_write_lock = threading.RLock()
+# Сколько векторов удалено с последней пересборки: удаленные занимают место в индексе до нее
+_deleted_since_rebuild = 0
+
+# Результаты поиска по форумам для конкретной сессии не попадают в общую коллекцию
+session_store = SessionVectorStore(
+    embedding_function,
+    ttl=SESSION_NAMESPACE_TTL,
+    max_chunks=SESSION_NAMESPACE_MAX_CHUNKS,
+    gc_interval=SESSION_GC_INTERVAL,
+    m=HNSW_M,
+    ef_construction=HNSW_EF_CONSTRUCTION,
+    ef_search=HNSW_EF_SEARCH,
+)
+
+def _get_loader(file_path: str):
     if file_path.endswith('.pdf'):
         loader = PyPDFLoader(file_path)
     elif file_path.endswith('.docx'):
@@ -21,75 +66,313 @@ def load_and_split_document(file_path: str) -> List[Document]:
         loader = UnstructuredHTMLLoader(file_path)
     else:
         raise ValueError(f"Unsupported file type: {file_path}")
+    return loader
 
-    documents = loader.load()
-    return text_splitter.split_documents(documents)
+def load_document(file_path: str) -> List[Document]:
+    return _get_loader(file_path).load()
 
-def index_document_to_chroma(file_path: str, file_id: int) -> bool:
-    try:
-        splits = load_and_split_document(file_path)
+def iter_document_pages(file_path: str) -> Iterator[Document]:
+    """Страницы по одной: PDF читается постранично, DOCX и HTML отдаются одним документом"""
+    return _get_loader(file_path).lazy_load()
+
+def load_and_split_document(file_path: str) -> List[Document]:
+    return text_splitter.split_documents(load_document(file_path))
+
+def _add_chunks(documents, ids, embeddings=None):
+    """Единая точка записи: векторное хранилище, BM25-индекс и версия коллекции для кэша поиска.
+
+    С готовыми embeddings чанки пишутся без обращения к модели эмбеддингов.
+    """
+    with _write_lock:
+        if embeddings is None:
+            vector_store.add(documents, ids)
+        else:
+            vector_store.upsert(ids, embeddings, documents)
+        lexical_index.add_chunks(ids, documents)
+    bump_collection_version()
+    return ids
+
+def _delete_chunks(ids):
+    global _deleted_since_rebuild
+    with _write_lock:
+        vector_store.delete(ids=ids)
+        lexical_index.delete_chunks(ids)
+        _deleted_since_rebuild += len(ids)
+    bump_collection_version()
+
+def _document_chunk_ids(file_id, chunks):
+    """Детерминированные id чанков: повторная запись после перезапуска перезаписывает их, а не дублирует"""
+    batch = {}
+    for chunk in chunks:
+        batch.setdefault(content_hash(chunk.page_content), chunk)
+    return [f"{file_id}-{chunk_hash}" for chunk_hash in batch], list(batch), list(batch.values())
+
+def _reusable_embeddings(chunk_hashes):
+    """Эмбеддинги уже проиндексированных чанков с тем же текстом: хэш -> вектор"""
+    sources = get_chunk_sources(chunk_hashes)
+    if not sources:
+        return {}
+    stored = vector_store.get(ids=list(sources.values()), include=["embeddings"])
+    vectors = dict(zip(stored["ids"], stored["embeddings"]))
+    return {chunk_hash: vectors[chunk_id] for chunk_hash, chunk_id in sources.items() if chunk_id in vectors}
 
-        for split in splits:
-            split.metadata['file_id'] = file_id
+def _index_document_batch(file_id, chunks):
+    """Пишет пачку чанков документа; неизменившиеся чанки берут готовый вектор вместо эмбеддинга"""
+    ids, hashes, chunks = _document_chunk_ids(file_id, chunks)
+    if not chunks:
+        return
+    reusable = _reusable_embeddings(hashes)
+    fresh = [i for i, chunk_hash in enumerate(hashes) if chunk_hash not in reusable]
+    reused = [i for i, chunk_hash in enumerate(hashes) if chunk_hash in reusable]
+    if fresh:
+        _add_chunks([chunks[i] for i in fresh], ids=[ids[i] for i in fresh])
+    if reused:
+        _add_chunks([chunks[i] for i in reused], ids=[ids[i] for i in reused],
+                    embeddings=[reusable[hashes[i]] for i in reused])
+        print(f"Reused {len(reused)} of {len(chunks)} chunk embeddings for document {file_id}")
+    insert_document_chunks(file_id, zip(ids, hashes))
 
-        vectorstore.add_documents(splits)
+def index_document_to_chroma(file_path: str, file_id: int, progress=None, start_page=0, chunks_embedded=0) -> bool:
+    """Потоковая индексация: страница -> чанки -> пачки по INDEX_BATCH_SIZE в векторное хранилище.
+
+    В памяти одновременно не больше одной страницы и одной пачки чанков. progress(**fields)
+    получает pages_parsed, pages_committed, chunks_total и chunks_embedded; индексация,
+    прерванная падением, продолжается с start_page = pages_committed.
+    """
+    buffer = []
+    created_at = int(time.time())
+    pages_parsed = start_page
+    chunks_total = chunks_embedded
+    persisted_chunks = chunks_embedded
+    persisted_at = time.monotonic()
+
+    def flush():
+        nonlocal buffer, chunks_embedded
+        _index_document_batch(file_id, buffer)
+        chunks_embedded += len(buffer)
+        buffer = []
+
+    try:
+        for page_number, page in enumerate(iter_document_pages(file_path)):
+            if page_number < start_page:
+                continue
+            for chunk in text_splitter.split_documents([page]):
+                chunk.metadata['file_id'] = file_id
+                chunk.metadata['created_at'] = created_at
+                buffer.append(chunk)
+                chunks_total += 1
+                if len(buffer) >= INDEX_BATCH_SIZE:
+                    flush()
+            pages_parsed = page_number + 1
+            if progress:
+                progress(pages_parsed=pages_parsed, chunks_total=chunks_total)
+            # Страница зафиксирована, только когда все ее чанки записаны. На границе страницы пачка
+            # сбрасывается уже с половины: точки возобновления чаще, а вызовы эмбеддинга не мельчают
+            if len(buffer) >= INDEX_BATCH_SIZE // 2 or not buffer:
+                flush()
+                # Страница считается зафиксированной, только когда ее векторы на диске
+                if (vector_store.persists_on_write
+                        or chunks_embedded - persisted_chunks >= VECTOR_PERSIST_CHUNKS
+                        or time.monotonic() - persisted_at >= VECTOR_PERSIST_INTERVAL):
+                    vector_store.persist()
+                    persisted_chunks, persisted_at = chunks_embedded, time.monotonic()
+                    if progress:
+                        progress(pages_committed=pages_parsed, chunks_embedded=chunks_embedded)
+
+        flush()
+        vector_store.persist()
+        if progress:
+            progress(pages_committed=pages_parsed, chunks_embedded=chunks_embedded)
         return True
     except Exception as e:
         print(f"Error indexing document: {e}")
         return False
 
 def delete_doc_from_chroma(file_id: int):
+    global _deleted_since_rebuild
     try:
-        docs = vectorstore.get(where={"file_id": file_id})
-        print(f"Found {len(docs['ids'])} document chunks for file_id {file_id}")
-
-        vectorstore._collection.delete(where={"file_id": file_id})
-        print(f"Deleted all documents with file_id {file_id}")
+        with _write_lock:
+            deleted = vector_store.delete(where={"file_id": file_id})
+            lexical_index.delete_file(file_id)
+            _deleted_since_rebuild += deleted
+            vector_store.persist()
+        bump_collection_version()
+        print(f"Deleted {deleted} document chunks with file_id {file_id}")
 
         return True
     except Exception as e:
-        print(f"Error deleting document with file_id {file_id} from Chroma: {str(e)}")
+        print(f"Error deleting document with file_id {file_id} from vector store: {str(e)}")
         return False
     
 
-def search_forum(query, selected_sites):
-    sucsess = False
+SITE_SEARCHERS = {
+    "Stackoverflow": search_stackoverflow,
+    "Reddit": search_reddit,
+    "Habr": search_habr,
+    "Mail.ru": search_mailru,
+    "GeekForGeeks": search_geekforgeeks,
+}
+
+# Сколько ждем сайт сверх его дедлайна, чтобы он успел вернуть частичный результат
+SITE_RESULT_GRACE = 2.0
+
+_site_pool = ThreadPoolExecutor(max_workers=len(SITE_SEARCHERS), thread_name_prefix="forum-site")
+
+def _run_site_search(site, searcher, query, deadline):
+    texts = scrape_cache.get_search(site, query)
+    if texts is not None:
+        print(f"{site}: результат взят из кэша")
+        return texts, time.monotonic(), True
+    texts = searcher(query, deadline=deadline)
+    return texts, time.monotonic(), False
+
+def search_forum(query, selected_sites, session_id=None):
+    """Опрашивает сайты параллельно и возвращает отчет по каждому сайту.
+
+    С session_id найденное кладется в пространство этой сессии, без него - в общее хранилище.
+    """
+    started = time.monotonic()
+    global_deadline = started + FORUM_SEARCH_DEADLINE
+
+    report = {}
+    pending = {}
     for site in selected_sites:
-        if site == "Stackoverflow":
-            texts = search_stackoverflow(query)
-            sucsess = process_and_store_texts('Stackoverflow', texts)
-        if site == "Reddit":
-            texts = search_reddit(query)
-            sucsess = process_and_store_texts('Reddit', texts)
-        if site == "Habr":
-            texts = search_habr(query)
-            sucsess = process_and_store_texts('Habr', texts)
-        if site == "Mail.ru":
-            texts = search_mailru(query)
-            sucsess = process_and_store_texts('Mail.ru', texts)
-        if site == "GeekForGeeks":
-            texts = search_geekforgeeks(query)
-            sucsess = process_and_store_texts('GeekForGeeks', texts)
-    return sucsess
+        searcher = SITE_SEARCHERS.get(site)
+        if searcher is None:
+            report[site] = {"success": False, "status": "unknown_site"}
+            continue
+        site_deadline = min(global_deadline, started + FORUM_SITE_TIMEOUTS.get(site, FORUM_SITE_TIMEOUT))
+        pending[site] = (_site_pool.submit(_run_site_search, site, searcher, query, site_deadline), site_deadline)
+
+    for site, (future, site_deadline) in pending.items():
+        try:
+            texts, finished_at, cached = future.result(timeout=max(0, site_deadline + SITE_RESULT_GRACE - time.monotonic()))
+        except TimeoutError:
+            print(f"{site}: превышено время ожидания")
+            report[site] = {"success": False, "status": "timeout", "elapsed": round(time.monotonic() - started, 2)}
+            continue
+        except Exception as e:
+            print(f"{site}: ошибка поиска: {e}")
+            report[site] = {"success": False, "status": "error", "error": str(e),
+                            "elapsed": round(time.monotonic() - started, 2)}
+            continue
+
+        success = process_and_store_texts(site, texts, session_id)
+        if not success:
+            status = "empty"
+        elif finished_at >= site_deadline:
+            status = "partial"
+        else:
+            status = "ok"
+            if not cached:
+                # Неполные результаты не кэшируем, чтобы не закрепить их на весь TTL
+                scrape_cache.put_search(site, query, texts)
+        report[site] = {"success": success, "status": status, "texts": len(texts), "cached": cached,
+                        "elapsed": round(finished_at - started, 2)}
+
+    return report
             
     
-def process_and_store_texts(site, texts):
+# Размер страницы при обходе всей коллекции
+SCAN_BATCH_SIZE = 1000
+
+_forum_simhashes = None
+_forum_simhashes_lock = threading.Lock()
+
+def _iter_collection(include):
+    offset = 0
+    while True:
+        batch = vector_store.get(include=include, limit=SCAN_BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            break
+        yield batch
+        offset += len(batch["ids"])
+
+def _get_forum_simhashes():
+    """Индекс отпечатков уже сохраненных чанков форумов, строится один раз при первой записи"""
+    global _forum_simhashes
+    if _forum_simhashes is None:
+        index = SimHashIndex()
+        for batch in _iter_collection(["metadatas"]):
+            for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+                if metadata and metadata.get("simhash"):
+                    index.add(chunk_id, int(metadata["simhash"], 16))
+        _forum_simhashes = index
+    return _forum_simhashes
+
+def _select_new_chunks(documents, ids):
+    """Позиции чанков, которых нет в коллекции и которые не повторяют сохраненные или друг друга.
+    Вызывается под _forum_simhashes_lock"""
+    existing = set(vector_store.get(ids=ids, include=[])["ids"])
+    simhashes = _get_forum_simhashes()
+    batch = SimHashIndex()
+    selected = []
+    for i, (document, chunk_id) in enumerate(zip(documents, ids)):
+        if chunk_id in existing:
+            continue
+        fingerprint = int(document.metadata["simhash"], 16)
+        if simhashes.find(fingerprint) is not None or batch.find(fingerprint) is not None:
+            continue
+        batch.add(chunk_id, fingerprint)
+        selected.append(i)
+    return selected
+
+def _store_new_chunks(documents, ids):
+    """Добавляет только чанки, которых еще нет в коллекции; эмбеддинги для дубликатов не считаются.
+
+    Эмбеддинги считаются без блокировки, чтобы параллельные поиски по сайтам не ждали друг друга;
+    отпечатки попадают в индекс только после успешной записи.
+    """
+    with _forum_simhashes_lock:
+        selected = _select_new_chunks(documents, ids)
+    candidates = [documents[i] for i in selected]
+    candidate_ids = [ids[i] for i in selected]
+    embeddings = embedding_function.embed_documents([doc.page_content for doc in candidates])
+
+    with _forum_simhashes_lock:
+        # Пока считались эмбеддинги, похожие чанки мог записать поиск по другому сайту
+        kept = _select_new_chunks(candidates, candidate_ids) if candidates else []
+        new_documents = [candidates[i] for i in kept]
+        new_ids = [candidate_ids[i] for i in kept]
+        if new_documents:
+            _add_chunks(new_documents, new_ids, embeddings=[embeddings[i] for i in kept])
+            simhashes = _get_forum_simhashes()
+            for document, chunk_id in zip(new_documents, new_ids):
+                simhashes.add(chunk_id, int(document.metadata["simhash"], 16))
+
+    print(f"Новых чанков: {len(new_ids)}, пропущено дубликатов: {len(ids) - len(new_ids)}")
+    return len(new_ids)
+
+def process_and_store_texts(site, texts, session_id=None):
     try: 
         if not texts:
             print("Нет данных для обработки")
             return False
         
         documents = []
+        ids = []
+        seen = set()
+        created_at = int(time.time())
         for text in texts:
             if not isinstance(text, str):
                 print(f"Пропущен некорректный элемент: {text}, тип: {type(text)}")
                 continue
             chunks = text_splitter.split_text(text)
             for i, chunk in enumerate(chunks):
-                documents.append(Document(page_content=chunk, metadata={"source": f"{site}"}))
+                chunk_id = content_hash(chunk)
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                documents.append(Document(page_content=chunk,
+                                          metadata={"source": f"{site}", "simhash": f"{simhash(chunk):016x}",
+                                                    "created_at": created_at}))
+                ids.append(chunk_id)
         
         if documents:
-            vectorstore.add_documents(documents)
+            if session_id:
+                session_store.add(session_id, documents, ids)
+            else:
+                _store_new_chunks(documents, ids)
             return True
         else:
             print("Нет чанков для добавления")
@@ -97,3 +380,87 @@ def process_and_store_texts(site, texts):
     except Exception as e:
         print(f"Error indexing document: {e}")
         return False
+
+def compact_forum_duplicates():
+    """Удаляет из коллекции точные и почти-дубликаты чанков форумов, оставляя первое вхождение"""
+    global _forum_simhashes
+    with _forum_simhashes_lock:
+        seen_hashes = set()
+        index = SimHashIndex()
+        duplicates = []
+        for batch in _iter_collection(["documents", "metadatas"]):
+            for chunk_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                metadata = metadata or {}
+                if "file_id" in metadata:
+                    continue
+                digest = content_hash(text)
+                fingerprint = int(metadata["simhash"], 16) if metadata.get("simhash") else simhash(text)
+                if digest in seen_hashes or index.find(fingerprint) is not None:
+                    duplicates.append(chunk_id)
+                    continue
+                seen_hashes.add(digest)
+                index.add(chunk_id, fingerprint)
+
+        for i in range(0, len(duplicates), SCAN_BATCH_SIZE):
+            _delete_chunks(duplicates[i:i + SCAN_BATCH_SIZE])
+        _forum_simhashes = index
+        print(f"Удалено дубликатов: {len(duplicates)}")
+        return len(duplicates)
+
+def evict_forum_chunks(max_age, max_count):
+    """Удаляет чанки форумов старше max_age секунд и самые старые сверх max_count.
+
+    Чанки без created_at (сохраненные до появления поля) считаются самыми старыми.
+    """
+    global _forum_simhashes
+    with _forum_simhashes_lock:
+        forum_chunks = []
+        for batch in _iter_collection(["metadatas"]):
+            for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+                metadata = metadata or {}
+                if "file_id" not in metadata:
+                    forum_chunks.append((metadata.get("created_at", 0), chunk_id))
+        forum_chunks.sort()
+
+        expired_before = time.time() - max_age
+        expired = sum(1 for created_at, _ in forum_chunks if created_at < expired_before)
+        evict = max(expired, len(forum_chunks) - max_count)
+        evicted = [chunk_id for _, chunk_id in forum_chunks[:evict]]
+        for i in range(0, len(evicted), SCAN_BATCH_SIZE):
+            _delete_chunks(evicted[i:i + SCAN_BATCH_SIZE])
+        if evicted:
+            # Отпечатки удаленных чанков не должны мешать сохранить их снова
+            _forum_simhashes = None
+        print(f"Удалено чанков форумов: {len(evicted)} (по возрасту: {expired}), осталось {len(forum_chunks) - len(evicted)}")
+        return len(evicted)
+
+def deleted_since_rebuild():
+    return _deleted_since_rebuild
+
+def rebuild_collection():
+    """Пересобирает индекс с уже посчитанными векторами, чтобы его файлы не хранили удаленные.
+
+    Новый индекс строится рядом с действующим и подменяет его целиком (VectorBackend.compact).
+    """
+    global _deleted_since_rebuild
+    with _forum_simhashes_lock, _write_lock:
+        total = vector_store.compact()
+        _deleted_since_rebuild = 0
+    bump_collection_version()
+    print(f"Collection rebuilt: {total} vectors")
+    return total
+
+def sync_lexical_index():
+    """Достраивает BM25-индекс по чанкам, которые попали в хранилище до его появления"""
+    total = vector_store.count()
+    if lexical_index.count() >= total:
+        return 0
+    print(f"Building lexical index for {total} chunks")
+    added = 0
+    for batch in _iter_collection(["documents", "metadatas"]):
+        documents = [Document(page_content=text, metadata=metadata or {})
+                     for text, metadata in zip(batch["documents"], batch["metadatas"])]
+        lexical_index.add_chunks(batch["ids"], documents)
+        added += len(documents)
+    print(f"Lexical index synced: {lexical_index.count()} chunks")
+    return added
@@ -0,0 +1,6 @@
+# api/compact_chroma.py
+# Разовая чистка ./chroma_db от дубликатов чанков форумов: python compact_chroma.py
+from chroma_utils import compact_forum_duplicates
+
+if __name__ == "__main__":
+    compact_forum_duplicates()
@@ -0,0 +1,139 @@
+# api/config.py
+import os
+
+def _env_list(name, default=""):
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+# Ollama
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+# Модели, которые загружаются в Ollama при старте сервера, например "llama3.2,llama3.1"
+WARMUP_MODELS = _env_list("WARMUP_MODELS")
+
+# Поиск по форумам
+FORUM_SEARCH_DEADLINE = float(os.getenv("FORUM_SEARCH_DEADLINE", "30"))
+FORUM_SITE_TIMEOUT = float(os.getenv("FORUM_SITE_TIMEOUT", "20"))
+# Selenium-парсерам нужно больше времени, чем API-запросам
+FORUM_SITE_TIMEOUTS = {
+    "Habr": float(os.getenv("FORUM_TIMEOUT_HABR", "25")),
+    "Mail.ru": float(os.getenv("FORUM_TIMEOUT_MAILRU", "25")),
+    "GeekForGeeks": float(os.getenv("FORUM_TIMEOUT_GEEKFORGEEKS", "25")),
+}
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "10"))
+PAGE_FETCH_WORKERS = int(os.getenv("PAGE_FETCH_WORKERS", "8"))
+
+# Пул headless-браузеров для Selenium-парсеров
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "3"))
+# После стольких аренд браузер перезапускается, чтобы не копить память
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "50"))
+BROWSER_PAGE_TIMEOUT = float(os.getenv("BROWSER_PAGE_TIMEOUT", "15"))
+
+# Дисковый кэш результатов парсинга
+SCRAPE_CACHE_DB = os.getenv("SCRAPE_CACHE_DB", "scrape_cache.db")
+SCRAPE_CACHE_SEARCH_TTL = int(os.getenv("SCRAPE_CACHE_SEARCH_TTL", str(60 * 60)))
+SCRAPE_CACHE_PAGE_TTL = int(os.getenv("SCRAPE_CACHE_PAGE_TTL", str(24 * 60 * 60)))
+SCRAPE_CACHE_MAX_BYTES = int(os.getenv("SCRAPE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Фоновая индексация загруженных документов
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+# Максимальный размер загружаемого файла и размер блока при потоковой записи
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Эмбеддинги
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Число процессов для индексации; 0 или 1 - кодировать в текущем процессе
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(os.cpu_count() or 1)))
+EMBED_THREADS_PER_WORKER = int(os.getenv("EMBED_THREADS_PER_WORKER", "1"))
+# Меньшие наборы кодируются локально: пересылка в процессы обходится дороже
+EMBED_PARALLEL_MIN = int(os.getenv("EMBED_PARALLEL_MIN", "128"))
+
+# Поиск и кэши поиска
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "2"))
+QUERY_EMBEDDING_CACHE_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_BYTES", str(16 * 1024 * 1024)))
+RETRIEVAL_CACHE_BYTES = int(os.getenv("RETRIEVAL_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# Переформулировка вопроса с учетом истории
+# Отдельная небольшая модель для переформулировки; пусто - используется модель чата
+CONTEXTUALIZE_MODEL = os.getenv("CONTEXTUALIZE_MODEL", "")
+REWRITE_CACHE_BYTES = int(os.getenv("REWRITE_CACHE_BYTES", str(4 * 1024 * 1024)))
+# Гибридный поиск: сколько кандидатов берем из вектора и BM25 перед слиянием
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_INDEX_DB = os.getenv("LEXICAL_INDEX_DB", "lexical_index.db")
+
+# Переранжирование кандидатов cross-encoder'ом на CPU
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "1") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_QUANTIZE = os.getenv("RERANK_QUANTIZE", "1") == "1"
+
+# Бюджет токенов промпта (num_ctx модели в Ollama)
+MODEL_CONTEXT_WINDOWS = {
+    "llama3.2": int(os.getenv("CONTEXT_WINDOW_LLAMA3_2", "4096")),
+    "llama3.1": int(os.getenv("CONTEXT_WINDOW_LLAMA3_1", "4096")),
+}
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "4096"))
+# Сколько токенов оставляем под ответ модели
+ANSWER_TOKEN_RESERVE = int(os.getenv("ANSWER_TOKEN_RESERVE", "1024"))
+# Доля бюджета, которую может занять история; остальное - найденные чанки
+HISTORY_TOKEN_SHARE = float(os.getenv("HISTORY_TOKEN_SHARE", "0.35"))
+
+# Сводка старой части диалога
+# Сколько последних ходов (вопрос + ответ) отправляется в модель дословно
+SUMMARY_KEEP_TURNS = int(os.getenv("SUMMARY_KEEP_TURNS", "4"))
+# Сводка обновляется, когда за окном накопилось столько новых ходов
+SUMMARY_MIN_NEW_TURNS = int(os.getenv("SUMMARY_MIN_NEW_TURNS", "2"))
+# Модель для сводок; пусто - модель чата
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "")
+
+# SQLite
+DB_NAME = os.getenv("DB_NAME", "rag_app.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# Фоновая запись логов чата: размер пачки и сколько ждать ее заполнения (секунды)
+LOG_WRITE_BATCH_SIZE = int(os.getenv("LOG_WRITE_BATCH_SIZE", "64"))
+LOG_WRITE_INTERVAL = float(os.getenv("LOG_WRITE_INTERVAL", "0.05"))
+
+# Пагинация списка чатов и истории
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+
+# Пространства сессий для результатов поиска по форумам (HNSW в памяти)
+# Пространство удаляется, если к нему не обращались столько секунд
+SESSION_NAMESPACE_TTL = float(os.getenv("SESSION_NAMESPACE_TTL", "3600"))
+SESSION_NAMESPACE_MAX_CHUNKS = int(os.getenv("SESSION_NAMESPACE_MAX_CHUNKS", "5000"))
+SESSION_GC_INTERVAL = float(os.getenv("SESSION_GC_INTERVAL", "60"))
+# Параметры HNSW: связность графа, ширина поиска при построении и при запросе
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# Основное векторное хранилище: chroma, hnsw (hnswlib в процессе) или quantized (int8 с пересчетом)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", f"./{VECTOR_BACKEND}_db")
+# HNSW основного хранилища; по умолчанию как у Chroma. M и ef_construction применяются
+# при создании индекса (или после пересборки), ef_search - сразу
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "100"))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "100"))
+# quantized: сколько кандидатов на каждый из k пересчитывается по float-векторам
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "4"))
+# In-process индекс сбрасывается на диск целиком, поэтому при индексации документа - не чаще,
+# чем раз в столько новых чанков или секунд; страницы фиксируются только в эти моменты
+VECTOR_PERSIST_CHUNKS = int(os.getenv("VECTOR_PERSIST_CHUNKS", "2048"))
+VECTOR_PERSIST_INTERVAL = float(os.getenv("VECTOR_PERSIST_INTERVAL", "30"))
+
+# Обслуживание векторного хранилища: вытеснение чанков форумов и пересборка индекса
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", str(24 * 3600)))
+FORUM_CHUNK_MAX_AGE = float(os.getenv("FORUM_CHUNK_MAX_AGE", str(30 * 24 * 3600)))
+FORUM_CHUNK_MAX_COUNT = int(os.getenv("FORUM_CHUNK_MAX_COUNT", "50000"))
+# Индекс пересобирается, когда с прошлой пересборки удалено столько векторов
+REBUILD_MIN_DELETED = int(os.getenv("REBUILD_MIN_DELETED", "1000"))
+# Сколько пробных запросов для замера p95 задержки поиска
+MAINTENANCE_PROBE_QUERIES = int(os.getenv("MAINTENANCE_PROBE_QUERIES", "50"))
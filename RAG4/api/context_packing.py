@@ -0,0 +1,95 @@
+# api/context_packing.py
+import re
+from config import MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, ANSWER_TOKEN_RESERVE, HISTORY_TOKEN_SHARE
+from dedup import content_hash
+
+# Перекрытие чанков в text_splitter - 200 символов; короче этого совпадения считаем случайными
+MIN_OVERLAP_CHARS = 50
+MAX_OVERLAP_CHARS = 200
+
+def estimate_tokens(text):
+    """Грубая оценка без токенизатора модели: слова и знаки препинания"""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+def _message_text(message):
+    if isinstance(message, dict):
+        return message.get("content", "")
+    if isinstance(message, tuple):
+        return message[1]
+    return getattr(message, "content", "")
+
+def _trim_history(chat_history, budget):
+    """Оставляет самые свежие сообщения, которые помещаются в бюджет, целыми парами вопрос-ответ"""
+    leading = chat_history[:len(chat_history) % 2]
+    kept = []
+    used = 0
+    for start in range(len(chat_history) - 2, len(leading) - 1, -2):
+        pair = chat_history[start:start + 2]
+        tokens = sum(estimate_tokens(_message_text(message)) for message in pair)
+        if used + tokens > budget:
+            break
+        kept[:0] = pair
+        used += tokens
+    # Сообщение без пары в начале (например, сводка) сохраняется всегда
+    return leading + kept, used + sum(estimate_tokens(_message_text(message)) for message in leading)
+
+def _overlap(first, second):
+    for size in range(min(MAX_OVERLAP_CHARS, len(first), len(second)), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+def _score_key(doc):
+    # Сначала оценка cross-encoder'а, затем RRF; неоцененные reranker'ом идут после оцененных
+    rerank_score = doc.metadata.get("rerank_score")
+    return (rerank_score is not None, rerank_score or 0.0, doc.metadata.get("score", 0.0))
+
+def dedupe_chunks(documents):
+    """Убирает точные копии и склеивает соседние чанки одного источника по перекрытию"""
+    unique = []
+    seen = set()
+    for doc in documents:
+        digest = content_hash(doc.page_content)
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(doc)
+
+    merged = []
+    for doc in unique:
+        for kept in merged:
+            if kept.metadata.get("source") != doc.metadata.get("source"):
+                continue
+            size = _overlap(kept.page_content, doc.page_content)
+            if size:
+                kept.page_content += doc.page_content[size:]
+                break
+            size = _overlap(doc.page_content, kept.page_content)
+            if size:
+                kept.page_content = doc.page_content + kept.page_content[size:]
+                break
+        else:
+            merged.append(doc)
+    return merged
+
+def pack_context(inputs, model, fixed_prompt_tokens):
+    """Укладывает историю и чанки в бюджет токенов модели и логирует размер префилла"""
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    available = window - ANSWER_TOKEN_RESERVE - fixed_prompt_tokens - estimate_tokens(inputs["input"])
+
+    chat_history, history_tokens = _trim_history(list(inputs.get("chat_history") or []),
+                                                 int(available * HISTORY_TOKEN_SHARE))
+
+    context = []
+    context_tokens = 0
+    documents = sorted(dedupe_chunks(list(inputs.get("context") or [])), key=_score_key, reverse=True)
+    for doc in documents:
+        tokens = estimate_tokens(doc.page_content)
+        if history_tokens + context_tokens + tokens > available:
+            continue
+        context.append(doc)
+        context_tokens += tokens
+
+    prefill = fixed_prompt_tokens + estimate_tokens(inputs["input"]) + history_tokens + context_tokens
+    print(f"Prefill tokens for {model}: {prefill} (history {history_tokens} in {len(chat_history)} messages, "
+          f"context {context_tokens} in {len(context)}/{len(documents)} chunks, window {window})")
+    return {**inputs, "chat_history": chat_history, "context": context}
@@ -1,88 +1,418 @@
+import asyncio
+import base64
+import json
+import queue
 import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from config import DB_NAME, DB_POOL_SIZE, LOG_WRITE_BATCH_SIZE, LOG_WRITE_INTERVAL
 
-DB_NAME = "rag_app.db"
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def create_application_logs():
-    conn = get_db_connection()
-    conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     session_id TEXT,
-                     user_query TEXT,
-                     gpt_response TEXT,
-                     model TEXT,
-                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
-
-def create_document_store():
-    conn = get_db_connection()
-    conn.execute('''CREATE TABLE IF NOT EXISTS document_store
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     filename TEXT,
-                     upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+)
+
+class ConnectionPool:
+    """Пул SQLite-соединений: держит до size открытых соединений с настроенными pragma"""
+
+    def __init__(self, db_name, size, pragmas=PRAGMAS):
+        self.db_name = db_name
+        self.size = size
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=10)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            # Незакоммиченная транзакция (например, после исключения) не должна утечь следующему владельцу
+            if conn.in_transaction:
+                conn.rollback()
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+db_pool = ConnectionPool(DB_NAME, DB_POOL_SIZE)
+
+# Миграции применяются по порядку; номер последней примененной хранится в PRAGMA user_version
+MIGRATIONS = [
+    # 1: исходные таблицы
+    '''CREATE TABLE IF NOT EXISTS application_logs
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            user_query TEXT,
+            gpt_response TEXT,
+            model TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+       CREATE TABLE IF NOT EXISTS document_store
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT,
+            upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP);''',
+    # 2: очередь индексации
+    '''CREATE TABLE IF NOT EXISTS ingest_jobs
+           (id TEXT PRIMARY KEY,
+            filename TEXT,
+            path TEXT,
+            file_id INTEGER,
+            status TEXT,
+            pages_parsed INTEGER DEFAULT 0,
+            chunks_total INTEGER DEFAULT 0,
+            chunks_embedded INTEGER DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);''',
+    # 3: сводки сессий
+    '''CREATE TABLE IF NOT EXISTS session_summaries
+           (session_id TEXT PRIMARY KEY,
+            summary TEXT,
+            summarized_turns INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);''',
+    # 4: индексы для истории, списка сессий, документов и очереди
+    '''CREATE INDEX IF NOT EXISTS idx_application_logs_session_created ON application_logs (session_id, created_at);
+       CREATE INDEX IF NOT EXISTS idx_document_store_upload_timestamp ON document_store (upload_timestamp);
+       CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status_created ON ingest_jobs (status, created_at);''',
+    # 5: сводная таблица сессий для списка чатов; поддерживается триггером при вставке хода
+    '''CREATE TABLE IF NOT EXISTS chat_sessions
+           (session_id TEXT PRIMARY KEY,
+            title TEXT,
+            first_message_at TIMESTAMP,
+            last_message_at TIMESTAMP,
+            turn_count INTEGER);
+       CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_message ON chat_sessions (last_message_at, session_id);
+       INSERT OR REPLACE INTO chat_sessions (session_id, title, first_message_at, last_message_at, turn_count)
+           SELECT s.session_id,
+                  'Чат от ' || s.first_message_at || ' (' || substr(
+                      (SELECT l.user_query FROM application_logs l WHERE l.session_id = s.session_id
+                       ORDER BY l.created_at, l.id LIMIT 1), 1, 30) || '...)',
+                  s.first_message_at, s.last_message_at, s.turn_count
+           FROM (SELECT session_id, MIN(created_at) AS first_message_at, MAX(created_at) AS last_message_at,
+                        COUNT(*) AS turn_count
+                 FROM application_logs GROUP BY session_id) s;
+       CREATE TRIGGER IF NOT EXISTS application_logs_after_insert AFTER INSERT ON application_logs BEGIN
+           INSERT INTO chat_sessions (session_id, title, first_message_at, last_message_at, turn_count)
+               VALUES (new.session_id, 'Чат от ' || new.created_at || ' (' || substr(new.user_query, 1, 30) || '...)',
+                       new.created_at, new.created_at, 1)
+               ON CONFLICT(session_id) DO UPDATE SET last_message_at = max(last_message_at, excluded.last_message_at),
+                                                     turn_count = turn_count + 1;
+       END;''',
+    # 6: точка возобновления потоковой индексации
+    '''ALTER TABLE ingest_jobs ADD COLUMN pages_committed INTEGER DEFAULT 0;''',
+    # 7: хэш содержимого документа и хэши его чанков для повторного использования эмбеддингов
+    '''ALTER TABLE document_store ADD COLUMN content_hash TEXT;
+       CREATE INDEX IF NOT EXISTS idx_document_store_content_hash ON document_store (content_hash);
+       CREATE TABLE IF NOT EXISTS document_chunks
+           (file_id INTEGER,
+            chunk_id TEXT,
+            chunk_hash TEXT,
+            PRIMARY KEY (file_id, chunk_id));
+       CREATE INDEX IF NOT EXISTS idx_document_chunks_chunk_hash ON document_chunks (chunk_hash);''',
+]
+
+def run_migrations():
+    with db_pool.connection() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.executescript(f'BEGIN; {script} PRAGMA user_version = {number}; COMMIT;')
+            print(f"Applied database migration {number}")
 
 def insert_application_logs(session_id, user_query, gpt_response, model):
-    conn = get_db_connection()
-    conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
-                 (session_id, user_query, gpt_response, model))
-    conn.commit()
-    conn.close()
+    with db_pool.connection() as conn:
+        conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)',
+                     (session_id, user_query, gpt_response, model))
+        conn.commit()
+
+class ApplicationLogWriter:
+    """Пишет application_logs пачками в отдельном потоке, чтобы запись не задерживала ответ"""
+
+    def __init__(self, pool, batch_size, interval):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue()
+        self._pending = Counter()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id, user_query, gpt_response, model, on_commit=None):
+        """Ставит ход в очередь; on_commit вызывается после фиксации пачки"""
+        # Время берем сейчас, а не при записи: порядок ходов не зависит от задержки пачки
+        created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        with self._cond:
+            self._pending[session_id] += 1
+        self._queue.put((session_id, user_query, gpt_response, model, created_at, on_commit))
+
+    def wait_for(self, session_id, timeout=5):
+        """Ждет записи ожидающих ходов сессии, чтобы чтение видело собственные записи"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending[session_id], timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with self.pool.connection() as conn:
+                conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response, model, created_at) '
+                                 'VALUES (?, ?, ?, ?, ?)', [item[:5] for item in batch])
+                conn.commit()
+        except Exception as e:
+            print(f"[db] Failed to write {len(batch)} chat log entries: {e}")
+        finally:
+            with self._cond:
+                for item in batch:
+                    self._pending[item[0]] -= 1
+                    if not self._pending[item[0]]:
+                        del self._pending[item[0]]
+                self._cond.notify_all()
+        for item in batch:
+            if item[5] is not None:
+                try:
+                    item[5]()
+                except Exception as e:
+                    print(f"[db] Chat log callback failed: {e}")
+
+    def close(self):
+        """Дописывает очередь и останавливает поток"""
+        self._queue.put(None)
+        self._thread.join()
+
+log_writer = ApplicationLogWriter(db_pool, LOG_WRITE_BATCH_SIZE, LOG_WRITE_INTERVAL)
 
 def get_chat_history(session_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at', (session_id,))
+    log_writer.wait_for(session_id)
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at', (session_id,))
+        messages = []
+        for row in cursor.fetchall():
+            messages.extend([
+                {"role": "human", "content": row['user_query']},
+                {"role": "ai", "content": row['gpt_response']}
+            ])
+    return messages
+
+def get_chat_history_page(session_id, limit, cursor=None):
+    """Последние limit ходов до cursor (в хронологическом порядке) и курсор на более ранние"""
+    log_writer.wait_for(session_id)
+    with db_pool.connection() as conn:
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            rows = conn.execute('''SELECT id, user_query, gpt_response, created_at FROM application_logs
+                                   WHERE session_id = ? AND (created_at, id) < (?, ?)
+                                   ORDER BY created_at DESC, id DESC LIMIT ?''',
+                                (session_id, created_at, row_id, limit + 1)).fetchall()
+        else:
+            rows = conn.execute('''SELECT id, user_query, gpt_response, created_at FROM application_logs
+                                   WHERE session_id = ?
+                                   ORDER BY created_at DESC, id DESC LIMIT ?''',
+                                (session_id, limit + 1)).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
     messages = []
-    for row in cursor.fetchall():
+    for row in reversed(rows[:limit]):
         messages.extend([
             {"role": "human", "content": row['user_query']},
             {"role": "ai", "content": row['gpt_response']}
         ])
-    conn.close()
-    return messages
+    return {"messages": messages, "next_cursor": next_cursor}
 
-def insert_document_record(filename):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO document_store (filename) VALUES (?)', (filename,))
-    file_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+def count_chat_turns(session_id):
+    log_writer.wait_for(session_id)
+    with db_pool.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM application_logs WHERE session_id = ?', (session_id,)).fetchone()[0]
+
+def get_chat_turns(session_id, offset=0, limit=-1):
+    """Ходы диалога по порядку, начиная с offset-го"""
+    log_writer.wait_for(session_id)
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at, id LIMIT ? OFFSET ?',
+                       (session_id, limit, offset))
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_session_summary(session_id):
+    with db_pool.connection() as conn:
+        row = conn.execute('SELECT summary, summarized_turns FROM session_summaries WHERE session_id = ?', (session_id,)).fetchone()
+    return dict(row) if row else None
+
+def upsert_session_summary(session_id, summary, summarized_turns):
+    with db_pool.connection() as conn:
+        conn.execute('''INSERT INTO session_summaries (session_id, summary, summarized_turns) VALUES (?, ?, ?)
+                        ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary,
+                            summarized_turns = excluded.summarized_turns, updated_at = CURRENT_TIMESTAMP''',
+                     (session_id, summary, summarized_turns))
+        conn.commit()
+
+def insert_document_record(filename, content_hash=None):
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO document_store (filename, content_hash) VALUES (?, ?)', (filename, content_hash))
+        file_id = cursor.lastrowid
+        conn.commit()
     return file_id
 
 def delete_document_record(file_id):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM document_store WHERE id = ?', (file_id,))
-    conn.commit()
-    conn.close()
+    with db_pool.connection() as conn:
+        conn.execute('DELETE FROM document_store WHERE id = ?', (file_id,))
+        conn.execute('DELETE FROM document_chunks WHERE file_id = ?', (file_id,))
+        conn.commit()
     return True
 
+def find_document_by_hash(content_hash):
+    """Уже загруженный документ с тем же содержимым и его последняя задача индексации"""
+    with db_pool.connection() as conn:
+        row = conn.execute('''SELECT d.id AS file_id, j.id AS job_id FROM document_store d
+                              LEFT JOIN ingest_jobs j ON j.file_id = d.id
+                              WHERE d.content_hash = ?
+                              ORDER BY j.created_at DESC LIMIT 1''', (content_hash,)).fetchone()
+    return dict(row) if row else None
+
+def insert_document_chunks(file_id, chunks):
+    """chunks: пары (chunk_id, chunk_hash)"""
+    with db_pool.connection() as conn:
+        conn.executemany('INSERT OR IGNORE INTO document_chunks (file_id, chunk_id, chunk_hash) VALUES (?, ?, ?)',
+                         [(file_id, chunk_id, chunk_hash) for chunk_id, chunk_hash in chunks])
+        conn.commit()
+
+def get_chunk_sources(chunk_hashes):
+    """Для каждого известного хэша - id уже проиндексированного чанка с тем же текстом"""
+    sources = {}
+    chunk_hashes = list(chunk_hashes)
+    with db_pool.connection() as conn:
+        # SQLite ограничивает число параметров запроса
+        for i in range(0, len(chunk_hashes), 500):
+            batch = chunk_hashes[i:i + 500]
+            placeholders = ", ".join("?" * len(batch))
+            for row in conn.execute(f'SELECT chunk_hash, chunk_id FROM document_chunks WHERE chunk_hash IN ({placeholders})', batch):
+                sources.setdefault(row["chunk_hash"], row["chunk_id"])
+    return sources
+
 def get_all_documents():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, filename, upload_timestamp FROM document_store ORDER BY upload_timestamp DESC')
-    documents = cursor.fetchall()
-    conn.close()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, filename, upload_timestamp FROM document_store ORDER BY upload_timestamp DESC')
+        documents = cursor.fetchall()
     return [dict(doc) for doc in documents]
 
-def get_all_chat_sessions():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT session_id, MIN(created_at) as last_message_time, user_query
-        FROM application_logs
-        GROUP BY session_id
-        ORDER BY last_message_time DESC
-    ''')
-    sessions = [{"session_id": row["session_id"], "title": f"Чат от {row['last_message_time']} ({row['user_query'][:30]}...)"}
-                for row in cursor.fetchall()]
-    conn.close()
-    return sessions
-
-create_application_logs()
-create_document_store()
\ No newline at end of file
+# Курсор keyset-пагинации: позиция последней отданной строки, непрозрачная для клиента
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor, size=2):
+    """Значения курсора; любой испорченный курсор (не тот base64/JSON, не та длина) - ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError:
+        values = None
+    if (not isinstance(values, list) or len(values) != size
+            or not all(isinstance(value, (str, int, float)) for value in values)):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+def get_chat_sessions_page(limit, cursor=None):
+    """Сессии от последней активной к давним: limit штук после cursor и курсор следующей страницы"""
+    with db_pool.connection() as conn:
+        if cursor:
+            last_message_at, session_id = decode_cursor(cursor)
+            rows = conn.execute('''SELECT * FROM chat_sessions
+                                   WHERE (last_message_at, session_id) < (?, ?)
+                                   ORDER BY last_message_at DESC, session_id DESC LIMIT ?''',
+                                (last_message_at, session_id, limit + 1)).fetchall()
+        else:
+            rows = conn.execute('''SELECT * FROM chat_sessions
+                                   ORDER BY last_message_at DESC, session_id DESC LIMIT ?''',
+                                (limit + 1,)).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]["last_message_at"], rows[limit - 1]["session_id"]) if len(rows) > limit else None
+    return {"sessions": [dict(row) for row in rows[:limit]], "next_cursor": next_cursor}
+
+def insert_ingest_job(job_id, filename, path, file_id):
+    with db_pool.connection() as conn:
+        conn.execute('INSERT INTO ingest_jobs (id, filename, path, file_id, status) VALUES (?, ?, ?, ?, ?)',
+                     (job_id, filename, path, file_id, "queued"))
+        conn.commit()
+
+def claim_next_ingest_job():
+    """Атомарно переводит самую старую задачу из queued в running и возвращает ее"""
+    with db_pool.connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute("SELECT * FROM ingest_jobs WHERE status = 'queued' ORDER BY created_at, rowid LIMIT 1").fetchone()
+        if row:
+            conn.execute("UPDATE ingest_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (row['id'],))
+        conn.commit()
+    return dict(row) if row else None
+
+def update_ingest_job(job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with db_pool.connection() as conn:
+        conn.execute(f'UPDATE ingest_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     (*fields.values(), job_id))
+        conn.commit()
+
+def get_ingest_job(job_id):
+    with db_pool.connection() as conn:
+        row = conn.execute('SELECT * FROM ingest_jobs WHERE id = ?', (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def requeue_interrupted_ingest_jobs():
+    """Задачи, прерванные остановкой сервера, снова ставятся в очередь"""
+    with db_pool.connection() as conn:
+        cursor = conn.execute("UPDATE ingest_jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP WHERE status = 'running'")
+        conn.commit()
+    return cursor.rowcount
+
+# Асинхронные обертки для обработчиков FastAPI: запрос к базе не блокирует event loop
+async def aget_chat_history_page(session_id, limit, cursor=None):
+    return await asyncio.to_thread(get_chat_history_page, session_id, limit, cursor)
+
+async def aget_chat_sessions_page(limit, cursor=None):
+    return await asyncio.to_thread(get_chat_sessions_page, limit, cursor)
+
+async def aget_all_documents():
+    return await asyncio.to_thread(get_all_documents)
+
+async def aget_ingest_job(job_id):
+    return await asyncio.to_thread(get_ingest_job, job_id)
+
+run_migrations()
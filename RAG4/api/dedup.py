@@ -0,0 +1,59 @@
+# api/dedup.py
+import hashlib
+import re
+
+SIMHASH_BITS = 64
+# Четыре полосы по 16 бит: при расстоянии <= 3 хотя бы одна полоса совпадет целиком
+SIMHASH_BANDS = 4
+NEAR_DUPLICATE_DISTANCE = 3
+
+def normalize_text(text):
+    return " ".join(text.lower().split())
+
+def content_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+def simhash(text):
+    weights = [0] * SIMHASH_BITS
+    for shingle in _shingles(text):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+class SimHashIndex:
+    """Поиск почти-дубликатов по SimHash через совпадение одной из полос отпечатка"""
+
+    def __init__(self, max_distance=NEAR_DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self._band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        self._buckets = [{} for _ in range(SIMHASH_BANDS)]
+
+    def _bands(self, fingerprint):
+        mask = (1 << self._band_bits) - 1
+        return [fingerprint >> (i * self._band_bits) & mask for i in range(SIMHASH_BANDS)]
+
+    def add(self, chunk_id, fingerprint):
+        for bucket, band in zip(self._buckets, self._bands(fingerprint)):
+            bucket.setdefault(band, []).append((chunk_id, fingerprint))
+
+    def find(self, fingerprint):
+        """id ближайшего сохраненного чанка в пределах max_distance или None"""
+        for bucket, band in zip(self._buckets, self._bands(fingerprint)):
+            for chunk_id, candidate in bucket.get(band, ()):
+                if hamming_distance(fingerprint, candidate) <= self.max_distance:
+                    return chunk_id
+        return None
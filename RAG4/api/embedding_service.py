@@ -0,0 +1,101 @@
+# api/embedding_service.py
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+_worker_model = None
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+def _encode_in_worker(batch):
+    return _worker_model.encode(batch, batch_size=len(batch), convert_to_numpy=True).tolist()
+
+class EmbeddingService(Embeddings):
+    """SentenceTransformer с батчами, отсортированными по длине, и пулом процессов для индексации"""
+
+    def __init__(self, model_name, batch_size=64, workers=1, threads_per_worker=1, parallel_min=128):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.parallel_min = parallel_min
+        self._model = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {"chunks": 0, "seconds": 0.0, "calls": 0}
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn, а не fork: форк процесса с уже загруженным torch может зависнуть
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.model_name, self.threads_per_worker),
+                    )
+        return self._pool
+
+    def _batches(self, texts):
+        """Батчи из текстов близкой длины, чтобы не тратить время на паддинг"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            yield indices, [texts[i] for i in indices]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        started = time.perf_counter()
+        vectors = [None] * len(texts)
+        batches = list(self._batches(texts))
+
+        if self.workers > 1 and len(texts) >= self.parallel_min:
+            results = self._get_pool().map(_encode_in_worker, [batch for _, batch in batches])
+        else:
+            model = self._get_model()
+            results = (model.encode(batch, batch_size=len(batch), convert_to_numpy=True).tolist()
+                       for _, batch in batches)
+
+        for (indices, _), embeddings in zip(batches, results):
+            for i, embedding in zip(indices, embeddings):
+                vectors[i] = embedding
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats["chunks"] += len(texts)
+            self._stats["seconds"] += elapsed
+            self._stats["calls"] += 1
+        print(f"Embedded {len(texts)} chunks in {elapsed:.2f}s ({len(texts) / elapsed:.1f} chunks/sec)")
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._get_model().encode(text, convert_to_numpy=True).tolist()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["chunks_per_sec"] = round(stats["chunks"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        stats["seconds"] = round(stats["seconds"], 3)
+        return stats
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
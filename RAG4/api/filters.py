@@ -0,0 +1,98 @@
+# api/filters.py
+"""Область поиска (сайты, документы, время) в виде Chroma where, его проверка в Python и перевод в SQL"""
+import re
+
+def build_where(scope, known_sites):
+    """Chroma where для области поиска; None - искать по всей коллекции.
+
+    Сайты ограничивают только чанки форумов, file_ids - только документы: если задано
+    одно, чанки другого вида остаются в поиске целиком.
+    """
+    if scope is None:
+        return None
+    clauses = []
+    if scope.sites or scope.file_ids:
+        sites = {"source": {"$in": list(scope.sites or known_sites)}}
+        documents = {"file_id": {"$in": list(scope.file_ids)}} if scope.file_ids else {"file_id": {"$gte": 0}}
+        clauses.append({"$or": [sites, documents]})
+    if scope.created_after is not None:
+        clauses.append({"created_at": {"$gte": int(scope.created_after.timestamp())}})
+    if scope.created_before is not None:
+        clauses.append({"created_at": {"$lte": int(scope.created_before.timestamp())}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+_SQL_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def where_to_sql(where, columns=None, metadata_column="metadata"):
+    """Условие SQL и параметры для where; поля из columns берутся из колонок, остальные из JSON метаданных.
+
+    Семантика как у matches_where: у чанка без поля выражение NULL, и условие не выполняется.
+    """
+    columns = columns or {}
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(clause, columns, metadata_column) for clause in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")" if parts else "1")
+            for _, part_params in parts:
+                params.extend(part_params)
+            continue
+        if key in columns:
+            field = columns[key]
+        elif _FIELD_NAME.match(key):
+            field = f"json_extract({metadata_column}, '$.{key}')"
+        else:
+            raise ValueError(f"Unsupported metadata field in where: {key}")
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator in ("$in", "$nin"):
+                if not operand:
+                    clauses.append("0" if operator == "$in" else f"{field} IS NOT NULL")
+                    continue
+                negate = "NOT " if operator == "$nin" else ""
+                clauses.append(f"{field} {negate}IN ({', '.join('?' * len(operand))})")
+                params.extend(operand)
+            else:
+                clauses.append(f"{field} {_SQL_OPERATORS[operator]} ?")
+                params.append(operand)
+    return " AND ".join(clauses) or "1", params
+
+def matches_where(metadata, where):
+    """Та же семантика, что у Chroma: чанк без поля из условия не подходит"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                try:
+                    if not _OPERATORS[operator](metadata[key], operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
@@ -0,0 +1,93 @@
+# api/job_queue.py
+import os
+import threading
+import traceback
+from db_utils import (claim_next_ingest_job, update_ingest_job, requeue_interrupted_ingest_jobs,
+                      delete_document_record)
+from chroma_utils import index_document_to_chroma, delete_doc_from_chroma
+from config import INGEST_WORKERS
+
+# Пауза после ошибки очереди (например, "database is locked"): удваивается до максимума
+ERROR_BACKOFF_INITIAL = 1
+ERROR_BACKOFF_MAX = 60
+
+class IngestWorkerPool:
+    """Пул потоков, разбирающий персистентную очередь ingest_jobs из rag_app.db"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        requeued = requeue_interrupted_ingest_jobs()
+        if requeued:
+            print(f"Возвращено в очередь прерванных задач: {requeued}")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._wakeup.set()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _run(self):
+        backoff = ERROR_BACKOFF_INITIAL
+        while not self._stopping.is_set():
+            # Ошибка SQLite не должна останавливать поток: иначе очередь больше не разбирается
+            try:
+                job = claim_next_ingest_job()
+                backoff = ERROR_BACKOFF_INITIAL
+                if job is None:
+                    self._wakeup.wait(timeout=5)
+                    self._wakeup.clear()
+                    continue
+                self._process(job)
+            except Exception as e:
+                print(f"[ingest] Worker error, retrying in {backoff}s: {e}")
+                traceback.print_exc()
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, ERROR_BACKOFF_MAX)
+
+    def _process(self, job):
+        job_id = job["id"]
+        print(f"[ingest] Processing job {job_id}: {job['filename']}")
+
+        def progress(**fields):
+            update_ingest_job(job_id, **fields)
+
+        try:
+            # После падения сервера задача продолжается с последней зафиксированной страницы
+            if job["pages_committed"]:
+                print(f"[ingest] Resuming job {job_id} from page {job['pages_committed']}")
+            success = index_document_to_chroma(job["path"], job["file_id"], progress=progress,
+                                               start_page=job["pages_committed"],
+                                               chunks_embedded=job["chunks_embedded"])
+            error = None if success else "Indexing failed"
+        except Exception as e:
+            traceback.print_exc()
+            success, error = False, str(e)
+
+        if success:
+            update_ingest_job(job_id, status="done")
+            print(f"[ingest] Job {job_id} done")
+        else:
+            # Частично добавленные чанки удаляем вместе с записью документа
+            delete_doc_from_chroma(job["file_id"])
+            delete_document_record(job["file_id"])
+            update_ingest_job(job_id, status="failed", error=error)
+            print(f"[ingest] Job {job_id} failed: {error}")
+
+        if os.path.exists(job["path"]):
+            os.remove(job["path"])
+
+ingest_pool = IngestWorkerPool(INGEST_WORKERS)
@@ -1,15 +1,21 @@
-from langchain_community.chat_models import ChatOllama
+from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from chroma_utils import vectorstore
+from retrieval import HybridRetriever
+from retrieval_cache import LRUCache
+from dedup import normalize_text
+from context_packing import pack_context, estimate_tokens
 from langchain.callbacks import StdOutCallbackHandler 
+from config import (OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_MAX_CONNECTIONS, RETRIEVAL_K,
+                    CONTEXTUALIZE_MODEL, REWRITE_CACHE_BYTES)
+import httpx
+import re
+import requests
+import threading
 
-retriever = vectorstore.as_retriever(
-    search_kwargs={
-        "k": 2,  
-    }
-)
+retriever = HybridRetriever(k=RETRIEVAL_K)
 
 contextualize_q_system_prompt = (
     "Given a chat history and the latest user question "
@@ -34,27 +40,157 @@ qa_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}")
 ])
 
-def get_rag_chain(model="gpt-4o-mini", verbose=False):
+# Слова, которые обычно ссылаются на предыдущие реплики
+REFERENCE_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she", "his", "her",
+    "above", "previous", "same", "again", "also", "there", "then", "one", "ones",
+    "он", "она", "оно", "они", "его", "ее", "её", "их", "ему", "ей", "им", "это", "этот", "эта", "эти",
+    "этого", "этой", "тот", "та", "те", "того", "там", "тогда", "выше", "еще", "ещё", "также", "тоже", "такой", "так",
+}
+# Короткие уточнения вроде "а на java?" без истории непонятны
+SHORT_QUESTION_WORDS = 3
 
-    llm = ChatOllama(
+_rewrite_cache = LRUCache(REWRITE_CACHE_BYTES)
+
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You maintain a running summary of a conversation between a user and an AI assistant. "
+               "Update the summary with the new turns. Keep facts, names, code identifiers, links and open questions. "
+               "Answer with the updated summary only, in the language of the conversation."),
+    ("human", "Current summary:\n{summary}\n\nNew turns:\n{turns}")
+])
+
+_rag_chains = {}
+_rag_chains_lock = threading.Lock()
+_llms = {}
+_llms_lock = threading.Lock()
+
+def _create_llm(model, verbose=False):
+    # Один экземпляр ChatOllama держит пул HTTP-соединений к серверу Ollama
+    return ChatOllama(
         model=model,
+        base_url=OLLAMA_BASE_URL,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        client_kwargs={"limits": httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                              max_keepalive_connections=OLLAMA_MAX_CONNECTIONS)},
         callbacks=[StdOutCallbackHandler()] if verbose else None
     )
+
+def get_llm(model, verbose=False):
+    key = (model, verbose)
+    llm = _llms.get(key)
+    if llm is None:
+        with _llms_lock:
+            llm = _llms.get(key)
+            if llm is None:
+                llm = _create_llm(model, verbose)
+                _llms[key] = llm
+    return llm
+
+def get_summary_chain(model):
+    return summary_prompt | get_llm(model) | StrOutputParser()
+
+def needs_rewrite(question, chat_history):
+    """Дешевая эвристика: переформулировать стоит только вопрос, который ссылается на историю"""
+    if not chat_history:
+        return False
+    words = re.findall(r"\w+", question.lower())
+    return len(words) <= SHORT_QUESTION_WORDS or any(word in REFERENCE_WORDS for word in words)
+
+def _rewrite_cache_key(inputs):
+    turn = inputs.get("turn", len(inputs.get("chat_history") or []) // 2)
+    return (inputs.get("session_id"), turn, normalize_text(inputs["input"]))
+
+def create_contextualizer(llm):
+    """Аналог create_history_aware_retriever без лишнего вызова LLM: вопрос переписывается
+    только когда нужно, а результат кэшируется на (сессия, ход)"""
+    rewrite_chain = contextualize_q_prompt | llm | StrOutputParser()
+
+    def cached_rewrite(inputs):
+        if not needs_rewrite(inputs["input"], inputs.get("chat_history")):
+            return inputs["input"], None
+        key = _rewrite_cache_key(inputs)
+        return _rewrite_cache.get(key), key
+
+    def store_rewrite(key, rewritten):
+        _rewrite_cache.put(key, rewritten, len(rewritten.encode("utf-8")))
+        print(f"Question rewritten: {rewritten[:100]}")
+        return rewritten
+
+    def contextualize(inputs):
+        question, key = cached_rewrite(inputs)
+        if question is not None:
+            return question
+        return store_rewrite(key, rewrite_chain.invoke(inputs))
+
+    async def acontextualize(inputs):
+        question, key = cached_rewrite(inputs)
+        if question is not None:
+            return question
+        return store_rewrite(key, await rewrite_chain.ainvoke(inputs))
+
+    return RunnableLambda(contextualize, afunc=acontextualize, name="contextualize_question")
+
+def build_rag_chain(model="gpt-4o-mini", verbose=False, llm=None):
+    """Собирает цепочку; llm по умолчанию общий для модели (get_llm)"""
+    llm = llm or get_llm(model, verbose)
+    rewrite_llm = get_llm(CONTEXTUALIZE_MODEL, verbose) if CONTEXTUALIZE_MODEL else llm
     
-    history_aware_retriever = create_history_aware_retriever(
-        llm, 
-        retriever, 
-        contextualize_q_prompt
-    )
+    # Область поиска (inputs["where"]) и пространство сессии у каждого запроса свои,
+    # поэтому передаются в retriever при вызове
+    def scoped_retrieve(inputs, config):
+        return retriever.invoke(inputs["question"], config, where=inputs.get("where"),
+                                session_id=inputs.get("session_id"))
+
+    async def ascoped_retrieve(inputs, config):
+        return await retriever.ainvoke(inputs["question"], config, where=inputs.get("where"),
+                                       session_id=inputs.get("session_id"))
+
+    history_aware_retriever = (
+        RunnablePassthrough.assign(question=create_contextualizer(rewrite_llm))
+        | RunnableLambda(scoped_retrieve, afunc=ascoped_retrieve, name="scoped_retriever")
+    ).with_config(run_name="chat_retriever_chain")
     
     question_answer_chain = create_stuff_documents_chain(
         llm, 
         qa_prompt
     )
     
-    rag_chain = create_retrieval_chain(
-        history_aware_retriever, 
-        question_answer_chain
-    )
+    # Историю для переформулировки вопроса не урезаем, бюджет применяется только к QA-промпту
+    fixed_prompt_tokens = sum(estimate_tokens(message.prompt.template) for message in qa_prompt.messages
+                              if hasattr(message, "prompt"))
+    pack = RunnableLambda(lambda inputs: pack_context(inputs, model, fixed_prompt_tokens), name="pack_context")
+
+    rag_chain = (
+        RunnablePassthrough.assign(context=history_aware_retriever.with_config(run_name="retrieve_documents"))
+        | pack
+    ).assign(answer=question_answer_chain).with_config(run_name="retrieval_chain")
     
     return rag_chain
+
+def get_rag_chain(model="gpt-4o-mini", verbose=False):
+    """Возвращает общую для всех запросов цепочку модели, собирая ее при первом обращении"""
+    key = (model, verbose)
+    rag_chain = _rag_chains.get(key)
+    if rag_chain is None:
+        with _rag_chains_lock:
+            rag_chain = _rag_chains.get(key)
+            if rag_chain is None:
+                rag_chain = build_rag_chain(model, verbose)
+                _rag_chains[key] = rag_chain
+    return rag_chain
+
+def warm_up_models(models):
+    """Собирает цепочки и загружает модели в память Ollama до первого запроса"""
+    for model in models:
+        get_rag_chain(model)
+        try:
+            # Запрос без prompt только загружает модель, генерации не происходит
+            response = requests.post(
+                f"{OLLAMA_BASE_URL}/api/generate",
+                json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE},
+                timeout=300
+            )
+            response.raise_for_status()
+            print(f"Model {model} warmed up")
+        except Exception as e:
+            print(f"Error warming up model {model}: {e}")
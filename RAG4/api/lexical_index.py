@@ -0,0 +1,90 @@
+# api/lexical_index.py
+import json
+import re
+import threading
+from langchain_core.documents import Document
+from db_utils import ConnectionPool
+from filters import where_to_sql
+from config import LEXICAL_INDEX_DB, DB_POOL_SIZE
+
+# Соединения переиспользуются: повторное открытие базы на каждый запрос дороже самого поиска
+index_pool = ConnectionPool(LEXICAL_INDEX_DB, DB_POOL_SIZE)
+_write_lock = threading.Lock()
+
+def create_lexical_index():
+    with index_pool.connection() as conn:
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS chunks
+                (id INTEGER PRIMARY KEY,
+                 chunk_id TEXT UNIQUE,
+                 file_id INTEGER,
+                 content TEXT,
+                 metadata TEXT);
+            CREATE INDEX IF NOT EXISTS idx_chunks_file_id ON chunks (file_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5
+                (content, content='chunks', content_rowid='id', tokenize="unicode61 tokenchars '_'");
+            CREATE TRIGGER IF NOT EXISTS chunks_after_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_after_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+        ''')
+        conn.commit()
+
+# Служебные слова встречаются почти в каждом чанке: они не влияют на ранжирование, но замедляют поиск
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "is", "are", "was", "be", "by",
+    "how", "what", "why", "when", "do", "does", "i", "my", "you", "can", "it", "this", "that", "from", "at",
+    "и", "в", "во", "на", "с", "со", "по", "к", "у", "о", "об", "а", "но", "не", "что", "как", "почему",
+    "для", "из", "за", "это", "ли", "же", "я", "мне", "то",
+}
+
+def _match_query(query):
+    """Каждый токен запроса - отдельная фраза через OR; идентификаторы вроде os.path.join ищутся как фраза"""
+    terms = []
+    for token in re.findall(r"[\w.]+", query.lower()):
+        token = token.strip(".")
+        if token and token not in STOPWORDS and token not in terms:
+            terms.append(token)
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def add_chunks(ids, documents):
+    rows = [(chunk_id, doc.metadata.get("file_id"), doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+            for chunk_id, doc in zip(ids, documents)]
+    with _write_lock, index_pool.connection() as conn:
+        conn.executemany('INSERT OR IGNORE INTO chunks (chunk_id, file_id, content, metadata) VALUES (?, ?, ?, ?)', rows)
+        conn.commit()
+
+def delete_chunks(ids):
+    with _write_lock, index_pool.connection() as conn:
+        conn.executemany('DELETE FROM chunks WHERE chunk_id = ?', [(chunk_id,) for chunk_id in ids])
+        conn.commit()
+
+def delete_file(file_id):
+    with _write_lock, index_pool.connection() as conn:
+        conn.execute('DELETE FROM chunks WHERE file_id = ?', (file_id,))
+        conn.commit()
+
+def count():
+    with index_pool.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+
+def search(query, limit, where=None):
+    """Top-limit чанков по BM25 (лучшие первыми); where (как у Chroma) проверяется в том же запросе"""
+    match = _match_query(query)
+    if not match:
+        return []
+    scope, params = where_to_sql(where, {"file_id": "c.file_id"}, "c.metadata") if where else ("1", [])
+    with index_pool.connection() as conn:
+        rows = conn.execute(f'''
+        SELECT c.chunk_id, c.content, c.metadata, bm25(chunks_fts) AS score
+        FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid
+        WHERE chunks_fts MATCH ? AND {scope}
+        ORDER BY score
+        LIMIT ?
+    ''', (match, *params, limit)).fetchall()
+    return [Document(page_content=row["content"], metadata=json.loads(row["metadata"]), id=row["chunk_id"])
+            for row in rows]
+
+create_lexical_index()
@@ -1,47 +1,121 @@
 # api/main.py
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from pydantic_models import QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic_models import QueryInput, QueryResponse, DocumentInfo, DeleteFileRequest, JobStatus, ChatSessionsPage, ChatHistoryPage
 from agents.coordinator import coordinator
+from agents.document_agent import UploadTooLarge
+from langchain_utils import warm_up_models
+from browser_pool import browser_pool
+from job_queue import ingest_pool
+from chroma_utils import embedding_function, session_store, sync_lexical_index, vector_store
+from retrieval_cache import cache_stats
+from retrieval import reranker
+from summarizer import summarizer
+from maintenance import maintenance
+from db_utils import db_pool, log_writer
+from config import WARMUP_MODELS, RERANK_ENABLED, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+from contextlib import asynccontextmanager
+import asyncio
 import logging
+import json
+import threading
+import uuid
 
 logging.basicConfig(filename='app.log', level=logging.INFO)
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ingest_pool.start()
+    session_store.start()
+    maintenance.start()
+    threading.Thread(target=sync_lexical_index, name="lexical-sync", daemon=True).start()
+    if WARMUP_MODELS:
+        await asyncio.to_thread(warm_up_models, WARMUP_MODELS)
+    if RERANK_ENABLED:
+        await asyncio.to_thread(reranker.warm_up)
+    yield
+    ingest_pool.stop()
+    maintenance.stop()
+    # Логи дописываются до остановки сводок: коллбеки записи ставят сводки в очередь
+    log_writer.close()
+    summarizer.close()
+    session_store.close()
+    vector_store.persist()
+    embedding_function.close()
+    browser_pool.close()
+    db_pool.close()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.post("/chat", response_model=QueryResponse)
 async def chat(query_input: QueryInput):
-    return coordinator.process_chat(query_input)
+    return await coordinator.aprocess_chat(query_input)
+
+@app.post("/chat/stream")
+async def chat_stream(query_input: QueryInput):
+    async def events():
+        async for event in coordinator.stream_chat(query_input):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
 @app.post("/forums-search")
 async def upload_parsed_document(query_input: QueryInput):
-    success = coordinator.forum_agent.process({
+    # Найденное хранится в пространстве сессии, поэтому новый чат получает session_id уже здесь
+    session_id = query_input.session_id or str(uuid.uuid4())
+    report = await asyncio.to_thread(coordinator.forum_agent.process, {
         "question": query_input.question,
-        "selected_sites": query_input.selected_sites
+        "selected_sites": query_input.selected_sites,
+        "session_id": session_id
     })
     
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to search forums.")
+    if report and not any(site_report["success"] for site_report in report.values()):
+        raise HTTPException(status_code=500, detail={"message": "Failed to search forums.", "sites": report,
+                                                     "session_id": session_id})
     
-    return {"message": "Forum search completed successfully"}
+    return {"message": "Forum search completed successfully", "sites": report, "session_id": session_id}
 
 @app.post("/upload-doc")
 async def upload_and_index_document(file: UploadFile = File(...)):
-    return coordinator.upload_document(file)
+    try:
+        return await asyncio.to_thread(coordinator.upload_document, file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str):
+    job = await coordinator.aget_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
 
 @app.get("/list-docs", response_model=list[DocumentInfo])
 async def list_documents():
-    return coordinator.list_documents()
+    return await coordinator.alist_documents()
 
 @app.post("/delete-doc")
 async def delete_document(request: DeleteFileRequest):
-    return coordinator.delete_document(request.file_id)
+    return await asyncio.to_thread(coordinator.delete_document, request.file_id)
+
+@app.get("/chat-sessions", response_model=ChatSessionsPage)
+async def get_chat_sessions(limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None):
+    try:
+        return await coordinator.aget_chat_sessions(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/chat-sessions")
-async def get_chat_sessions():
-    return coordinator.get_chat_sessions()
+@app.get("/chat-history", response_model=ChatHistoryPage)
+async def get_selected_chat_history(session_id: str, limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+                                    cursor: str | None = None):
+    try:
+        return await coordinator.aget_chat_history(session_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/chat-history")
-async def get_selected_chat_history(session_id: str):
-    return coordinator.get_chat_history(session_id)
+@app.get("/stats")
+async def get_stats():
+    return {"embedding": embedding_function.stats(), "cache": cache_stats(), "sessions": session_store.stats(),
+            "vector_store": vector_store.stats(), "maintenance": maintenance.last_report}
 
 @app.get("/")
 async def root():
@@ -0,0 +1,95 @@
+# api/maintenance.py
+# Фоновое обслуживание векторного хранилища; разовый запуск: python maintenance.py
+import threading
+import time
+from chroma_utils import vector_store, evict_forum_chunks, rebuild_collection, deleted_since_rebuild
+from config import (MAINTENANCE_INTERVAL, FORUM_CHUNK_MAX_AGE, FORUM_CHUNK_MAX_COUNT, REBUILD_MIN_DELETED,
+                    MAINTENANCE_PROBE_QUERIES, RETRIEVAL_K)
+
+def sample_probe_vectors(count):
+    """Векторы уже сохраненных чанков как пробные запросы: замер не зависит от модели эмбеддингов"""
+    batch = vector_store.get(include=["embeddings"], limit=count)
+    return [list(vector) for vector in batch["embeddings"]] if batch["ids"] else []
+
+def measure_p95(probes, k=RETRIEVAL_K):
+    if not probes:
+        return None
+    timings = []
+    for vector in probes:
+        started = time.perf_counter()
+        vector_store.search(vector, k)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return round(timings[max(int(len(timings) * 0.95) - 1, 0)] * 1000, 3)
+
+def snapshot(probes):
+    return {
+        "index_bytes": vector_store.size_bytes(),
+        "vectors": vector_store.count(),
+        "p95_ms": measure_p95(probes),
+    }
+
+class MaintenanceTask:
+    """Периодически вытесняет старые чанки форумов и пересобирает HNSW после удалений"""
+
+    def __init__(self, interval, max_age, max_count, rebuild_min_deleted, probe_queries):
+        self.interval = interval
+        self.max_age = max_age
+        self.max_count = max_count
+        self.rebuild_min_deleted = rebuild_min_deleted
+        self.probe_queries = probe_queries
+        self.last_report = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        started = time.monotonic()
+        probes = sample_probe_vectors(self.probe_queries)
+        before = snapshot(probes)
+
+        evicted = evict_forum_chunks(self.max_age, self.max_count)
+        rebuilt = deleted_since_rebuild() >= self.rebuild_min_deleted
+        if rebuilt:
+            rebuild_collection()
+        # Чанки форумов in-process хранилища пишутся на диск здесь и при остановке сервера
+        vector_store.persist()
+
+        after = snapshot(probes)
+        report = {
+            "evicted": evicted,
+            "rebuilt": rebuilt,
+            "before": before,
+            "after": after,
+            "elapsed": round(time.monotonic() - started, 2),
+            "finished_at": time.time(),
+        }
+        self.last_report = report
+        print(f"[maintenance] evicted {evicted}, rebuilt {rebuilt}: "
+              f"{before['vectors']} -> {after['vectors']} vectors, "
+              f"{before['index_bytes']} -> {after['index_bytes']} bytes, "
+              f"p95 {before['p95_ms']} -> {after['p95_ms']} ms")
+        return report
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[maintenance] Run failed: {e}")
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="vector-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+maintenance = MaintenanceTask(MAINTENANCE_INTERVAL, FORUM_CHUNK_MAX_AGE, FORUM_CHUNK_MAX_COUNT,
+                              REBUILD_MIN_DELETED, MAINTENANCE_PROBE_QUERIES)
+
+if __name__ == "__main__":
+    maintenance.run_once()
@@ -1,10 +1,61 @@
 from bs4 import BeautifulSoup
-import requests
+import json
 import time
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from browser_pool import browser_pool, wait_for
+from scrape_cache import fetch_page
+from config import REQUEST_TIMEOUT, PAGE_FETCH_WORKERS, SCRAPE_CACHE_SEARCH_TTL
 
-def search_stackoverflow(query: str):
+# Общий пул для загрузки страниц отдельных постов
+_page_pool = ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS, thread_name_prefix="page-fetch")
+
+def _remaining(deadline):
+    if deadline is None:
+        return REQUEST_TIMEOUT
+    return max(0.1, min(REQUEST_TIMEOUT, deadline - time.monotonic()))
+
+def _deadline_passed(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+def _gather(futures, deadline):
+    """Собирает результаты в исходном порядке; после дедлайна возвращает то, что успело загрузиться"""
+    results = {}
+    timeout = None if deadline is None else max(0, deadline - time.monotonic())
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            results[futures[future]] = future.result()
+    except TimeoutError:
+        print(f"Дедлайн истек, получено {len(results)} из {len(futures)} страниц")
+        for future in futures:
+            future.cancel()
+    return [results[i] for i in sorted(results) if results[i]]
+
+def _fetch_stackoverflow_answer(item, deadline):
+    url = item["link"]
+    try:
+        status_code, page = fetch_page(url, timeout=_remaining(deadline))
+        if status_code != 200:
+            print(f"Не удалось загрузить страницу {url}")
+            return None
+        
+        soup = BeautifulSoup(page, 'lxml')
+        question = soup.find('div', class_="s-prose js-post-body")
+        right_answer = soup.find('div', class_="answercell post-layout--right")
+        
+        if right_answer:
+            text = right_answer.find('div', class_="s-prose js-post-body")
+            if text and text.get_text(strip=True):
+                print(f"Добавлен текст для {url}")  # Отладка
+                return f"Title: {item['title']}\nLink: {item['link']}\nQuestion: {question.get_text()}\nAnswer: {text.get_text(strip=True)}"
+            else:
+                print(f"Не найден текст ответа для {url}")
+        else:
+            print(f"Не найден блок ответа для {url}")
+    except Exception as e:
+        print(f"Ошибка при обработке {url}: {e}")
+    return None
+
+def search_stackoverflow(query: str, deadline=None):
     url = "https://api.stackexchange.com/2.3/search/advanced"
     params = {
         "order": "desc",
@@ -13,96 +64,74 @@ def search_stackoverflow(query: str):
         "site": "stackoverflow",
         "pagesize": 5,
     }
-    response = requests.get(url, params=params)
+    # Выдача поискового API меняется быстрее постов: кэшируем на срок поиска, а не страницы
+    status_code, body = fetch_page(url, params=params, timeout=_remaining(deadline), ttl=SCRAPE_CACHE_SEARCH_TTL)
     
-    if response.status_code != 200:
-        raise Exception(f"Ошибка запроса: {response.status_code}")
+    if status_code != 200:
+        raise Exception(f"Ошибка запроса: {status_code}")
     
-    data = response.json()
-    combined_text = []
+    data = json.loads(body)
     
     print(f"Найдено элементов в API: {len(data['items'])}")  
-    for item in data["items"][:len(data['items'])]:
-        try:
-            url = item["link"]
-            response = requests.get(url)
-            if response.status_code != 200:
-                print(f"Не удалось загрузить страницу {url}")
-                continue
-            
-            soup = BeautifulSoup(response.text, 'lxml')
-            question = soup.find('div', class_="s-prose js-post-body")
-            right_answer = soup.find('div', class_="answercell post-layout--right")
-            
-            if right_answer:
-                text = right_answer.find('div', class_="s-prose js-post-body")
-                if text and text.get_text(strip=True):
-                    combined_text.append(f"Title: {item['title']}\nLink: {item['link']}\nQuestion: {question.get_text()}\nAnswer: {text.get_text(strip=True)}")
-                    print(f"Добавлен текст для {url}")  # Отладка
-                else:
-                    print(f"Не найден текст ответа для {url}")
-            else:
-                print(f"Не найден блок ответа для {url}")
-        except Exception as e:
-            print(f"Ошибка при обработке {url}: {e}")
+    futures = {
+        _page_pool.submit(_fetch_stackoverflow_answer, item, deadline): i
+        for i, item in enumerate(data["items"])
+    }
+    combined_text = _gather(futures, deadline)
     
     print(f"Итоговый список текстов: {combined_text}")  
     return combined_text
 
 
-def search_habr(query: str):
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    driver = webdriver.Chrome(options=options)
+def search_habr(query: str, deadline=None):
+    with browser_pool.lease(timeout=_remaining(deadline)) as driver:
+        search_url = f"https://habr.com/ru/search/?q={query}&target_type=posts&sort=relevance"
+        driver.get(search_url)
+        wait_for(driver, "div.tm-article-snippet", _remaining(deadline))
 
-    search_url = f"https://habr.com/ru/search/?q={query}&target_type=posts&sort=relevance"
-    driver.get(search_url)
-    time.sleep(3)  
+        soup = BeautifulSoup(driver.page_source, 'lxml')
+        posts = soup.find_all("div", class_="tm-article-snippet tm-article-snippet")
 
-    soup = BeautifulSoup(driver.page_source, 'lxml')
-    posts = soup.find_all("div", class_="tm-article-snippet tm-article-snippet")
+        articles = []
+        print(f"Найдено постов: {len(posts)}")
 
-    articles = []
-    print(f"Найдено постов: {len(posts)}")
+        post_counter=0
+        for post in posts:
+            post_counter+=1
+            if post_counter > 5:
+                break
+            if _deadline_passed(deadline):
+                print("Дедлайн истек, возвращаем собранные посты")
+                break
+            try:
+                link_tag = post.find("a", class_="tm-title__link")
+                if not link_tag:
+                    continue
 
-    post_counter=0
-    for post in posts:
-        post_counter+=1
-        if post_counter > 5:
-            break
-        try:
-            link_tag = post.find("a", class_="tm-title__link")
-            if not link_tag:
-                continue
-
-            title = link_tag.text.strip()
-            href = "https://habr.com" + link_tag["href"]
-
-            rating_tag = post.find("span", class_="tm-votes-meter__value")
-            rating = int(rating_tag.text.strip()) if rating_tag else 0
-
-            driver.get(href)
-            time.sleep(2)
-            article_soup = BeautifulSoup(driver.page_source, "lxml")
-            article_body = article_soup.find("div", id="post-content-body")
-            if not article_body:
-                continue
-
-            content = article_body.get_text(separator="\n", strip=True)
-            articles.append({
-                "title": title,
-                "link": href,
-                "content": content,
-                "likes": rating
-            })
-
-            print(f"Добавлен пост: {title} | 👍 {rating}")
-        except Exception as e:
-            print(f"Ошибка при обработке поста: {e}")
+                title = link_tag.text.strip()
+                href = "https://habr.com" + link_tag["href"]
+
+                rating_tag = post.find("span", class_="tm-votes-meter__value")
+                rating = int(rating_tag.text.strip()) if rating_tag else 0
+
+                driver.get(href)
+                wait_for(driver, "#post-content-body", _remaining(deadline))
+                article_soup = BeautifulSoup(driver.page_source, "lxml")
+                article_body = article_soup.find("div", id="post-content-body")
+                if not article_body:
+                    continue
 
-    driver.quit()
+                content = article_body.get_text(separator="\n", strip=True)
+                articles.append({
+                    "title": title,
+                    "link": href,
+                    "content": content,
+                    "likes": rating
+                })
+
+                print(f"Добавлен пост: {title} | 👍 {rating}")
+            except Exception as e:
+                print(f"Ошибка при обработке поста: {e}")
 
     top_articles = sorted(articles, key=lambda x: x["likes"], reverse=True)[:5]
 
@@ -115,7 +144,7 @@ def search_habr(query: str):
     return combined_text
 
 
-def search_reddit(query: str):
+def search_reddit(query: str, deadline=None):
     url = "https://www.reddit.com/r/all/search.json"
     params = {
         "q": query,
@@ -125,12 +154,13 @@ def search_reddit(query: str):
     
     headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36"}
     
-    response = requests.get(url, params=params, headers=headers)
+    status_code, body = fetch_page(url, params=params, headers=headers, timeout=_remaining(deadline),
+                                   ttl=SCRAPE_CACHE_SEARCH_TTL)
     
-    if response.status_code != 200:
-        raise Exception(f"Ошибка запроса: {response.status_code}")
+    if status_code != 200:
+        raise Exception(f"Ошибка запроса: {status_code}")
     
-    data = response.json()
+    data = json.loads(body)
     combined_text = []
     
     print(f"Найдено элементов в API: {len(data['data']['children'])}")  # Отладка
@@ -150,86 +180,83 @@ def search_reddit(query: str):
     print(f"Итоговый список текстов: {combined_text}") 
     return combined_text
 
-def search_mailru(query: str):
+def search_mailru(query: str, deadline=None):
     url = f"https://otvet.mail.ru/search/{query}"
 
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    driver = webdriver.Chrome(options=options)
-    
-    driver.get(url)
-    time.sleep(3)  
+    with browser_pool.lease(timeout=_remaining(deadline)) as driver:
+        driver.get(url)
+        wait_for(driver, "div.mMhMm", _remaining(deadline))
 
-    soup = BeautifulSoup(driver.page_source, 'lxml')
-    posts = soup.find_all('div', class_="mMhMm")
+        soup = BeautifulSoup(driver.page_source, 'lxml')
+        posts = soup.find_all('div', class_="mMhMm")
     
-    combined_text = []
-    
-    print(f"Найдено элементов в API: {len(posts)}")  
-    for post in posts:
-        try:
-            post=post.find('a', class_="KFtEM aR6dQ Ub4yk")
-            post_url = f"https://otvet.mail.ru{post['href']}"
-            post_title = post.get_text()
-            print(post_title)
-            driver.get(post_url)
-
-            soup = BeautifulSoup(driver.page_source, 'lxml')
-            question = soup.find('div', class_="aitWd PcSgH")
-            print("\nQuestion", question)
-            right_answer = soup.find('div', class_="aitWd _Jzbh")
-            print("\nRight_answer", right_answer)
-            if right_answer:
-                combined_text.append(f"Title: {post_title}\nLink: {post_url}\nQuestion: {question.get_text()}\nAnswer: {right_answer.get_text()}")
-                print(f"Добавлен текст для {url}")  
-            else:
-                print(f"Не найден блок ответа для {url}")
-        except Exception as e:
-            print(f"Ошибка при обработке поста: {e}")
+        combined_text = []
     
+        print(f"Найдено элементов в API: {len(posts)}")  
+        for post in posts:
+            if _deadline_passed(deadline):
+                print("Дедлайн истек, возвращаем собранные ответы")
+                break
+            try:
+                post=post.find('a', class_="KFtEM aR6dQ Ub4yk")
+                post_url = f"https://otvet.mail.ru{post['href']}"
+                post_title = post.get_text()
+                print(post_title)
+                driver.get(post_url)
+                wait_for(driver, "div.aitWd", _remaining(deadline))
+
+                soup = BeautifulSoup(driver.page_source, 'lxml')
+                question = soup.find('div', class_="aitWd PcSgH")
+                print("\nQuestion", question)
+                right_answer = soup.find('div', class_="aitWd _Jzbh")
+                print("\nRight_answer", right_answer)
+                if right_answer:
+                    combined_text.append(f"Title: {post_title}\nLink: {post_url}\nQuestion: {question.get_text()}\nAnswer: {right_answer.get_text()}")
+                    print(f"Добавлен текст для {url}")  
+                else:
+                    print(f"Не найден блок ответа для {url}")
+            except Exception as e:
+                print(f"Ошибка при обработке поста: {e}")
     
     print(f"Итоговый список текстов: {combined_text}")  
     return combined_text
 
-def search_geekforgeeks(query: str):
-    search_url = f"https://www.geeksforgeeks.org/search/?q={query}"
+def _fetch_geekforgeeks_article(item, deadline):
+    try:
+        title = item.find('div', class_="article-title")
+        link = title['href']
+        title_text = title.get_text(strip=True)
+
+        _, page = fetch_page(link, timeout=_remaining(deadline))
 
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    driver = webdriver.Chrome(options=options)
+        soup = BeautifulSoup(page, 'lxml')
+        discription = soup.find('div', class_="article--viewer_content")
+        print("\nDiscription", discription)
+        if discription:
+            print(f"Добавлен текст для {link}")
+            return f"Title: {title_text}\nLink: {link}\nDiscription: {discription}"
+        else:
+            print(f"Не найден блок ответа для {link}")
+    except Exception as e:
+        print(f"Ошибка при обработке элемента: {e}")
+    return None
 
-    driver.get(search_url)
-    time.sleep(3)  
+def search_geekforgeeks(query: str, deadline=None):
+    search_url = f"https://www.geeksforgeeks.org/search/?q={query}"
 
-    soup = BeautifulSoup(driver.page_source, 'lxml')
+    with browser_pool.lease(timeout=_remaining(deadline)) as driver:
+        driver.get(search_url)
+        wait_for(driver, "div.gcse-title", _remaining(deadline))
+        soup = BeautifulSoup(driver.page_source, 'lxml')
     
     search_results = soup.find_all('div', class_="gcse-title")
 
     print(f"Найдено элементов в API: {len(search_results)}")
-    combined_text = []
-
-    for item in search_results:
-        try:
-            title = item.find('div', class_="article-title")
-            link = title['href']
-            title_text = title.get_text(strip=True)
-
-            response = requests.get(link)
-
-            soup = BeautifulSoup(response, 'lxml')
-            discription = soup.find('div', class_="article--viewer_content")
-            print("\nDiscription", discription)
-            if discription:
-                combined_text.append(f"Title: {title_text}\nLink: {link}\nDiscription: {discription}")
-                print(f"Добавлен текст для {link}")
-            else:
-                print(f"Не найден блок ответа для {link}")
-        except Exception as e:
-            print(f"Ошибка при обработке элемента: {e}")
+    futures = {
+        _page_pool.submit(_fetch_geekforgeeks_article, item, deadline): i
+        for i, item in enumerate(search_results)
+    }
+    combined_text = _gather(futures, deadline)
 
     print(f"Итоговый список текстов: {combined_text}")  
     return combined_text
@@ -8,11 +8,18 @@ class ModelName(str, Enum):
     LLAMA3_2 = "llama3.2"
     LLAMA3_1 = "llama3.1"
 
+class RetrievalScope(BaseModel):
+    sites: list[str] | None = None
+    file_ids: list[int] | None = None
+    created_after: datetime | None = None
+    created_before: datetime | None = None
+
 class QueryInput(BaseModel):
     question: str
     session_id: str = Field(default=None)
     model: ModelName = Field(default=ModelName.LLAMA3_2)
     selected_sites: list = Field(default=None)
+    scope: RetrievalScope | None = Field(default=None)
 
 class QueryResponse(BaseModel):
     answer: str
@@ -26,3 +33,31 @@ class DocumentInfo(BaseModel):
 
 class DeleteFileRequest(BaseModel):
     file_id: int
+
+class ChatSessionInfo(BaseModel):
+    session_id: str
+    title: str
+    first_message_at: datetime
+    last_message_at: datetime
+    turn_count: int
+
+class ChatSessionsPage(BaseModel):
+    sessions: list[ChatSessionInfo]
+    next_cursor: str | None = None
+
+class ChatHistoryPage(BaseModel):
+    messages: list[dict]
+    next_cursor: str | None = None
+
+class JobStatus(BaseModel):
+    id: str
+    filename: str
+    file_id: int
+    status: str
+    pages_parsed: int
+    pages_committed: int
+    chunks_total: int
+    chunks_embedded: int
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
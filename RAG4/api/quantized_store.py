@@ -0,0 +1,266 @@
+# api/quantized_store.py
+import json
+import os
+import sys
+import threading
+import numpy as np
+
+# Сколько строк int8-матрицы переводим во float за раз при грубом поиске: временная
+# float32-копия блока - SCAN_BLOCK_ROWS * dim * 4 байт (6 МБ при 384 измерениях)
+SCAN_BLOCK_ROWS = 4096
+INITIAL_CAPACITY = 1024
+
+class QuantizedVectorIndex:
+    """Векторный индекс с int8-кодами для грубого поиска и точным пересчетом по float-векторам.
+
+    Каждый вектор нормируется и хранится как int8-код со своим масштабом (в 4 раза меньше
+    float32). Поиск идет полным проходом по кодам, затем top k * rescore_factor кандидатов
+    пересчитываются по исходным векторам в rescore_dtype (float16 почти не влияет на порядок).
+    Обе матрицы лежат в файлах через np.memmap: в памяти постоянно нужны только коды,
+    а float-векторы читаются лишь для кандидатов.
+
+    Экономия в основном по памяти. На диске рядом с кодами лежат float16-векторы, около
+    3 байт на измерение против ~4 у float32 HNSW с графом: файлы меньше лишь в 1.3-1.5 раза.
+
+    Файлы матриц помечены поколением из state.json: compact пишет новое поколение рядом
+    со старым, и оно становится действующим только вместе с новым state.json.
+    """
+
+    def __init__(self, path, rescore_factor=4, rescore_dtype="float16"):
+        self.path = path
+        self.rescore_factor = rescore_factor
+        self.rescore_dtype = np.dtype(rescore_dtype)
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self.generation = 0
+        self.ids = []
+        self.labels = {}
+        self.deleted = set()
+        self._codes = None
+        self._scales = None
+        self._vectors = None
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _files(self, generation=None):
+        generation = self.generation if generation is None else generation
+        return (f"codes-{generation}.int8", f"scales-{generation}.f32",
+                f"vectors-{generation}.{self.rescore_dtype.name}")
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _map(self, name, dtype, shape):
+        """memmap файла под shape; файл дорастает до нужного размера, содержимое сохраняется"""
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(self._file(name), "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(self._file(name), dtype=dtype, mode="r+", shape=shape)
+
+    def _map_all(self, generation, capacity):
+        codes, scales, vectors = self._files(generation)
+        return (self._map(codes, np.int8, (capacity, self.dim)),
+                self._map(scales, np.float32, (capacity,)),
+                self._map(vectors, self.rescore_dtype, (capacity, self.dim)))
+
+    def _open(self, capacity):
+        self.capacity = capacity
+        self._codes, self._scales, self._vectors = self._map_all(self.generation, capacity)
+
+    def _load(self):
+        if os.path.exists(self._file("state.json")):
+            with open(self._file("state.json"), encoding="utf-8") as f:
+                state = json.load(f)
+            self.dim = state["dim"]
+            self.rescore_dtype = np.dtype(state.get("rescore_dtype", self.rescore_dtype.name))
+            self.generation = state["generation"]
+            self.ids = state["ids"]
+            self.count = len(self.ids)
+            self.deleted = set(state["deleted"])
+            self.labels = {chunk_id: label for label, chunk_id in enumerate(self.ids) if label not in self.deleted}
+            if self.dim:
+                self._open(max(state["capacity"], self.count))
+        # Файлы другого поколения остаются от прерванного compact
+        current = set(self._files()) | {"state.json"}
+        for name in os.listdir(self.path):
+            if name not in current:
+                os.remove(self._file(name))
+
+    def _write_state(self):
+        state = {"dim": self.dim, "capacity": self.capacity, "rescore_dtype": self.rescore_dtype.name,
+                 "generation": self.generation, "ids": self.ids, "deleted": sorted(self.deleted)}
+        tmp_path = self._file("state.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._file("state.json"))
+
+    def persist(self):
+        with self._lock:
+            for array in (self._codes, self._scales, self._vectors):
+                if array is not None:
+                    array.flush()
+            self._write_state()
+
+    @staticmethod
+    def quantize(vectors):
+        """Нормированные float32-векторы -> (int8-коды, масштабы) с симметричным масштабом на вектор"""
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, ids, embeddings):
+        """Добавляет векторы; существующий id перезаписывается (старая версия помечается удаленной)"""
+        if not ids:
+            return
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._open(INITIAL_CAPACITY)
+            needed = self.count + len(ids)
+            if needed > self.capacity:
+                self._open(max(needed, self.capacity * 2))
+
+            codes, scales = self.quantize(vectors)
+            start = self.count
+            self._codes[start:needed] = codes
+            self._scales[start:needed] = scales
+            self._vectors[start:needed] = vectors.astype(self.rescore_dtype)
+            for offset, chunk_id in enumerate(ids):
+                previous = self.labels.get(chunk_id)
+                if previous is not None:
+                    self.deleted.add(previous)
+                self.labels[chunk_id] = start + offset
+                self.ids.append(chunk_id)
+            self.count = needed
+
+    def delete(self, ids):
+        with self._lock:
+            removed = 0
+            for chunk_id in ids:
+                label = self.labels.pop(chunk_id, None)
+                if label is not None:
+                    self.deleted.add(label)
+                    removed += 1
+            return removed
+
+    def get_vectors(self, ids):
+        """Сохраненные векторы по id в float32 (пропущенные id не возвращаются)"""
+        with self._lock:
+            found = [(chunk_id, self.labels[chunk_id]) for chunk_id in ids if chunk_id in self.labels]
+            return {chunk_id: np.asarray(self._vectors[label], dtype=np.float32) for chunk_id, label in found}
+
+    def _approximate_scores(self, query):
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, self.count)
+            scores[start:end] = (self._codes[start:end].astype(np.float32) @ query) * self._scales[start:end]
+        return scores
+
+    def search(self, embedding, k, allowed_ids=None, rescore=True):
+        """Top-k (id, косинусная близость) лучшими первыми; allowed_ids ограничивает кандидатов"""
+        query = self._normalize(embedding)
+        with self._lock:
+            if not self.count or k <= 0:
+                return []
+            scores = self._approximate_scores(query)
+            if self.deleted:
+                scores[list(self.deleted)] = -np.inf
+            if allowed_ids is not None:
+                mask = np.full(self.count, -np.inf, dtype=np.float32)
+                mask[[self.labels[chunk_id] for chunk_id in allowed_ids if chunk_id in self.labels]] = 0
+                scores += mask
+
+            live = int(np.isfinite(scores).sum())
+            candidates = min(k * self.rescore_factor if rescore else k, live)
+            if candidates == 0:
+                return []
+            labels = np.argpartition(-scores, candidates - 1)[:candidates]
+            if rescore:
+                # Точный пересчет: float-векторы читаются с диска только для кандидатов
+                order = np.sort(labels)
+                exact = np.asarray(self._vectors[order], dtype=np.float32) @ query
+                labels, scores = order, exact
+            else:
+                scores = scores[labels]
+            best = np.argsort(-scores)[:k]
+            return [(self.ids[labels[i]], float(scores[i])) for i in best]
+
+    def compact(self):
+        """Переписывает файлы без удаленных векторов и без запаса емкости.
+
+        Новое поколение пишется рядом; старое удаляется только после записи state.json,
+        поэтому при падении на любом шаге остается целое старое или целое новое поколение.
+        """
+        with self._lock:
+            if self.dim is None:
+                return 0
+            keep = np.array([label for label in range(self.count) if label not in self.deleted], dtype=np.int64)
+            generation = self.generation + 1
+            capacity = max(len(keep), 1)
+            codes, scales, vectors = self._map_all(generation, capacity)
+            for start in range(0, len(keep), SCAN_BLOCK_ROWS):
+                block = keep[start:start + SCAN_BLOCK_ROWS]
+                codes[start:start + len(block)] = self._codes[block]
+                scales[start:start + len(block)] = self._scales[block]
+                vectors[start:start + len(block)] = self._vectors[block]
+            for array in (codes, scales, vectors):
+                array.flush()
+
+            removed = self.count - len(keep)
+            old_files = self._files()
+            self.generation = generation
+            self.capacity = capacity
+            self._codes, self._scales, self._vectors = codes, scales, vectors
+            self.ids = [self.ids[label] for label in keep]
+            self.labels = {chunk_id: label for label, chunk_id in enumerate(self.ids)}
+            self.deleted = set()
+            self.count = len(self.ids)
+            self._write_state()
+            for name in old_files:
+                os.remove(self._file(name))
+            return removed
+
+    def reset(self):
+        with self._lock:
+            self._codes = self._scales = self._vectors = None
+            for name in (*self._files(), "state.json"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self.dim = None
+            self.count = self.capacity = self.generation = 0
+            self.ids, self.labels, self.deleted = [], {}, set()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _id_map_bytes(self):
+        """Память списка id и словаря id -> позиция (строки id общие у обоих)"""
+        return (sys.getsizeof(self.ids) + sum(sys.getsizeof(chunk_id) for chunk_id in self.ids)
+                + sys.getsizeof(self.labels) + sum(sys.getsizeof(label) for label in self.labels.values())
+                + sys.getsizeof(self.deleted))
+
+    def stats(self):
+        with self._lock:
+            dim = self.dim or 0
+            codes_bytes = self.count * (dim + 4)
+            return {
+                "vectors": len(self.labels),
+                "tombstones": len(self.deleted),
+                # Постоянно в памяти нужны коды с масштабами и карты id; float-векторы читаются для пересчета
+                "codes_bytes": codes_bytes,
+                "resident_bytes": codes_bytes + self._id_map_bytes(),
+                "rescore_bytes": self.count * dim * self.rescore_dtype.itemsize,
+                "disk_bytes": sum(os.path.getsize(self._file(name)) for name in os.listdir(self.path)),
+            }
@@ -0,0 +1,63 @@
+# api/reranker.py
+import threading
+import time
+from sentence_transformers import CrossEncoder
+
+class CrossEncoderReranker:
+    """Cross-encoder на CPU с ограничением по времени на один запрос"""
+
+    def __init__(self, model_name, batch_size=8, budget_ms=300, quantize=True):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.quantize = quantize
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    model = CrossEncoder(self.model_name, device="cpu")
+                    if self.quantize:
+                        # Динамическая int8-квантизация линейных слоев: в 2-3 раза быстрее на CPU
+                        import torch
+                        model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+                    self._model = model
+        return self._model
+
+    def warm_up(self):
+        self._get_model().predict([("warm up", "warm up")])
+
+    def rerank(self, query, documents, k):
+        """Скорит кандидатов батчами, пока укладывается в бюджет. Оцененные кандидаты
+        сортируются по оценке, остальные идут следом в исходном (векторном/RRF) порядке.
+
+        Загрузка модели входит в бюджет. Перед каждым батчем, включая первый, проверяется,
+        успеет ли он до дедлайна по времени предыдущего батча.
+        """
+        if len(documents) <= 1:
+            return documents[:k]
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000
+        model = self._get_model()
+
+        scores = []
+        batch_seconds = 0.0
+        for start in range(0, len(documents), self.batch_size):
+            batch_started = time.perf_counter()
+            if batch_started + batch_seconds >= deadline:
+                break
+            batch = documents[start:start + self.batch_size]
+            scores.extend(model.predict([(query, doc.page_content) for doc in batch], batch_size=len(batch)))
+            batch_seconds = time.perf_counter() - batch_started
+
+        scored = sorted(zip(scores, documents), key=lambda pair: pair[0], reverse=True)
+        for score, doc in scored:
+            doc.metadata["rerank_score"] = round(float(score), 4)
+        ranked = [doc for _, doc in scored] + documents[len(scores):]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        status = "complete" if len(scores) == len(documents) else "budget exceeded, vector order for the rest"
+        print(f"Rerank: {len(scores)}/{len(documents)} candidates in {elapsed_ms:.1f} ms ({status})")
+        return ranked[:k]
@@ -0,0 +1,98 @@
+# api/retrieval.py
+import asyncio
+import hashlib
+import json
+from array import array
+from typing import List
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from chroma_utils import vector_store, embedding_function, session_store
+from dedup import normalize_text, content_hash
+from config import (RETRIEVAL_CANDIDATES, RRF_K, RERANK_ENABLED, RERANK_MODEL, RERANK_CANDIDATES,
+                    RERANK_BATCH_SIZE, RERANK_BUDGET_MS, RERANK_QUANTIZE)
+from reranker import CrossEncoderReranker
+import lexical_index
+from retrieval_cache import query_embedding_cache, retrieval_result_cache, collection_version, documents_size
+
+reranker = CrossEncoderReranker(RERANK_MODEL, batch_size=RERANK_BATCH_SIZE,
+                                budget_ms=RERANK_BUDGET_MS, quantize=RERANK_QUANTIZE)
+
+def embed_query(query):
+    key = normalize_text(query)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        # float32 в array занимает в разы меньше памяти, чем список float
+        embedding = array("f", embedding_function.embed_query(query))
+        query_embedding_cache.put(key, embedding, embedding.itemsize * len(embedding) + len(key))
+    return embedding
+
+def _copy(documents):
+    return [Document(page_content=doc.page_content, metadata=dict(doc.metadata), id=doc.id) for doc in documents]
+
+def search(query, k, where=None):
+    """kNN по коллекции с кэшированием эмбеддинга запроса и результата поиска"""
+    embedding = embed_query(query)
+    version = collection_version()
+    key = (hashlib.sha1(embedding.tobytes()).hexdigest(), k, json.dumps(where, sort_keys=True))
+
+    cached = retrieval_result_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return _copy(cached[1])
+
+    documents = [doc for doc, _ in vector_store.search(embedding, k, where)]
+    retrieval_result_cache.put(key, (version, _copy(documents)), documents_size(documents))
+    return documents
+
+def _doc_key(doc):
+    return doc.id or content_hash(doc.page_content)
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """Сливает несколько ранжированных списков: score = sum(1 / (rrf_k + rank))"""
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    fused = []
+    for key in sorted(scores, key=scores.get, reverse=True)[:k]:
+        doc = documents[key]
+        doc.metadata["score"] = round(scores[key], 6)
+        fused.append(doc)
+    return fused
+
+def hybrid_search(query, k, where=None, session_id=None, candidates=RETRIEVAL_CANDIDATES):
+    """Векторный kNN и BM25 по candidates кандидатов каждый, слитые через RRF.
+
+    С session_id к ним добавляется kNN по пространству сессии с результатами форумов.
+    """
+    limit = max(k, candidates)
+    dense = search(query, limit, where)
+    lexical = lexical_index.search(query, limit, where)
+    rankings = [dense, lexical]
+    if session_id:
+        session = session_store.search(session_id, embed_query(query), limit, where)
+        if session:
+            rankings.append(session)
+    return reciprocal_rank_fusion(rankings, k)
+
+def retrieve(query, k, where=None, session_id=None):
+    """Гибридный поиск с запасом кандидатов и переранжированием cross-encoder'ом до top-k"""
+    if not RERANK_ENABLED:
+        return hybrid_search(query, k, where, session_id)
+    candidates = hybrid_search(query, max(k, RERANK_CANDIDATES), where, session_id)
+    return reranker.rerank(query, candidates, k)
+
+class HybridRetriever(BaseRetriever):
+    k: int = 2
+    where: dict | None = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                where: dict | None = None, session_id: str | None = None) -> List[Document]:
+        return retrieve(query, self.k, where or self.where, session_id)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       where: dict | None = None, session_id: str | None = None) -> List[Document]:
+        return await asyncio.to_thread(retrieve, query, self.k, where or self.where, session_id)
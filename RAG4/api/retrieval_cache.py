@@ -0,0 +1,85 @@
+# api/retrieval_cache.py
+import sys
+import threading
+from collections import OrderedDict
+from config import QUERY_EMBEDDING_CACHE_BYTES, RETRIEVAL_CACHE_BYTES
+
+class LRUCache:
+    """LRU-кэш, ограниченный суммарным размером значений в байтах"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+def documents_size(documents):
+    return sum(sys.getsizeof(doc.page_content) + sys.getsizeof(repr(doc.metadata)) for doc in documents)
+
+query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_BYTES)
+retrieval_result_cache = LRUCache(RETRIEVAL_CACHE_BYTES)
+
+# Версия коллекции растет при каждой записи; результаты поиска от старой версии не отдаются
+_collection_version = 0
+_version_lock = threading.Lock()
+
+def collection_version():
+    return _collection_version
+
+def bump_collection_version():
+    global _collection_version
+    with _version_lock:
+        _collection_version += 1
+    retrieval_result_cache.clear()
+
+def cache_stats():
+    return {
+        "collection_version": _collection_version,
+        "query_embeddings": query_embedding_cache.stats(),
+        "retrieval_results": retrieval_result_cache.stats(),
+    }
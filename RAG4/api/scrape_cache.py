@@ -0,0 +1,97 @@
+# api/scrape_cache.py
+import json
+import time
+import requests
+from db_utils import ConnectionPool
+from config import SCRAPE_CACHE_DB, SCRAPE_CACHE_SEARCH_TTL, SCRAPE_CACHE_PAGE_TTL, SCRAPE_CACHE_MAX_BYTES, DB_POOL_SIZE
+
+cache_pool = ConnectionPool(SCRAPE_CACHE_DB, DB_POOL_SIZE)
+
+def create_cache_table():
+    with cache_pool.connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries
+                        (key TEXT PRIMARY KEY,
+                         value TEXT,
+                         etag TEXT,
+                         last_modified TEXT,
+                         size INTEGER,
+                         stored_at REAL,
+                         accessed_at REAL)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed_at ON cache_entries (accessed_at)')
+        conn.commit()
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def _get_entry(key):
+    with cache_pool.connection() as conn:
+        row = conn.execute('SELECT value, etag, last_modified, stored_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row:
+            conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+    return row
+
+def _put_entry(key, value, etag=None, last_modified=None):
+    now = time.time()
+    with cache_pool.connection() as conn:
+        conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, etag, last_modified, size, stored_at, accessed_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (key, value, etag, last_modified, len(value.encode("utf-8")), now, now))
+        conn.commit()
+        _evict(conn)
+
+def _touch_entry(key):
+    now = time.time()
+    with cache_pool.connection() as conn:
+        conn.execute('UPDATE cache_entries SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+        conn.commit()
+
+def _evict(conn):
+    """Удаляет давно не читанные записи, пока кэш не уложится в лимит по размеру"""
+    total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries').fetchone()[0]
+    if total <= SCRAPE_CACHE_MAX_BYTES:
+        return
+    rows = conn.execute('SELECT key, size FROM cache_entries ORDER BY accessed_at').fetchall()
+    evicted = []
+    for row in rows:
+        if total <= SCRAPE_CACHE_MAX_BYTES:
+            break
+        evicted.append((row["key"],))
+        total -= row["size"]
+    conn.executemany('DELETE FROM cache_entries WHERE key = ?', evicted)
+    conn.commit()
+    print(f"Из кэша парсинга вытеснено записей: {len(evicted)}")
+
+def get_search(site, query):
+    """Свежий результат поиска по сайту или None"""
+    row = _get_entry(f"search:{site}:{normalize_query(query)}")
+    if row and time.time() - row["stored_at"] < SCRAPE_CACHE_SEARCH_TTL:
+        return json.loads(row["value"])
+    return None
+
+def put_search(site, query, texts):
+    _put_entry(f"search:{site}:{normalize_query(query)}", json.dumps(texts, ensure_ascii=False))
+
+def fetch_page(url, params=None, headers=None, timeout=None, ttl=SCRAPE_CACHE_PAGE_TTL):
+    """GET через кэш: свежая копия отдается без сети, устаревшая перепроверяется по ETag/Last-Modified.
+    Для поисковых API передается ttl=SCRAPE_CACHE_SEARCH_TTL. Возвращает (status_code, text)."""
+    key = "page:" + requests.Request("GET", url, params=params).prepare().url
+    row = _get_entry(key)
+    if row and time.time() - row["stored_at"] < ttl:
+        return 200, row["value"]
+
+    request_headers = dict(headers or {})
+    if row and row["etag"]:
+        request_headers["If-None-Match"] = row["etag"]
+    if row and row["last_modified"]:
+        request_headers["If-Modified-Since"] = row["last_modified"]
+
+    response = requests.get(url, params=params, headers=request_headers, timeout=timeout)
+    if response.status_code == 304 and row:
+        _touch_entry(key)
+        return 200, row["value"]
+    if response.status_code == 200:
+        _put_entry(key, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return response.status_code, response.text
+
+create_cache_table()
@@ -0,0 +1,179 @@
+# api/session_store.py
+import threading
+import time
+import hnswlib
+import numpy as np
+from langchain_core.documents import Document
+from dedup import SimHashIndex
+from filters import matches_where
+
+# Начальная емкость пространства; дальше растет удвоением до max_chunks
+INITIAL_CAPACITY = 256
+
+class SessionNamespace:
+    """HNSW-индекс в памяти с чанками форумов, найденными для одной сессии"""
+
+    def __init__(self, dim, max_chunks, m, ef_construction, ef_search):
+        self.max_chunks = max_chunks
+        self.ef_search = ef_search
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        self.index.init_index(max_elements=min(INITIAL_CAPACITY, max_chunks), M=m, ef_construction=ef_construction)
+        self.documents = []
+        self.ids = set()
+        self.simhashes = SimHashIndex()
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(doc):
+        return int(doc.metadata["simhash"], 16) if "simhash" in doc.metadata else None
+
+    def add(self, documents, embeddings):
+        """Добавляет не больше, чем осталось места до max_chunks; id и отпечатки
+        запоминаются только для добавленных чанков"""
+        room = self.max_chunks - len(self.documents)
+        documents, embeddings = documents[:room], embeddings[:room]
+        if not documents:
+            return 0
+        needed = len(self.documents) + len(documents)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(min(max(needed, self.index.get_max_elements() * 2), self.max_chunks))
+        labels = np.arange(len(self.documents), needed)
+        self.index.add_items(np.asarray(embeddings, dtype=np.float32), labels)
+        self.documents.extend(documents)
+        for doc in documents:
+            self.ids.add(doc.id)
+            fingerprint = self.fingerprint(doc)
+            if fingerprint is not None:
+                self.simhashes.add(doc.id, fingerprint)
+        return len(documents)
+
+    def search(self, embedding, k, where=None):
+        k = min(k, len(self.documents))
+        if k == 0:
+            return []
+        label_filter = None
+        if where:
+            # hnswlib падает, если фильтру удовлетворяет меньше k чанков, поэтому сначала считаем их
+            allowed = {label for label, doc in enumerate(self.documents) if matches_where(doc.metadata, where)}
+            k = min(k, len(allowed))
+            if k == 0:
+                return []
+            label_filter = allowed.__contains__
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(np.asarray(embedding, dtype=np.float32), k=k, filter=label_filter)
+        return [(self.documents[label], float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+class SessionVectorStore:
+    """Эфемерные пространства сессий: чанки форумов живут ttl секунд с последнего обращения"""
+
+    def __init__(self, embedding_function, ttl, max_chunks, gc_interval, m, ef_construction, ef_search):
+        self.embedding_function = embedding_function
+        self.ttl = ttl
+        self.max_chunks = max_chunks
+        self.gc_interval = gc_interval
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _namespace(self, session_id, dim=None):
+        with self._lock:
+            namespace = self._namespaces.get(session_id)
+            if namespace is None and dim is not None:
+                namespace = SessionNamespace(dim, self.max_chunks, self.m, self.ef_construction, self.ef_search)
+                self._namespaces[session_id] = namespace
+            if namespace is not None:
+                namespace.last_used = time.monotonic()
+            return namespace
+
+    def add(self, session_id, documents, ids):
+        """Добавляет новые для сессии чанки (дубликаты по id и SimHash пропускаются); возвращает их число"""
+        existing = self._namespace(session_id)
+        if existing is not None:
+            with existing.lock:
+                fresh = [(doc, chunk_id) for doc, chunk_id in zip(documents, ids) if chunk_id not in existing.ids]
+        else:
+            fresh = list(zip(documents, ids))
+        if not fresh:
+            return 0
+
+        created_at = int(time.time())
+        documents = []
+        for doc, chunk_id in fresh:
+            metadata = dict(doc.metadata, session_id=session_id, created_at=created_at)
+            documents.append(Document(page_content=doc.page_content, metadata=metadata, id=chunk_id))
+        embeddings = self.embedding_function.embed_documents([doc.page_content for doc in documents])
+
+        namespace = self._namespace(session_id, dim=len(embeddings[0]))
+        with namespace.lock:
+            new_documents, new_embeddings = [], []
+            # Почти-дубликаты внутри пачки: в пространство отпечатки попадут только после добавления
+            batch = SimHashIndex()
+            for doc, embedding in zip(documents, embeddings):
+                if doc.id in namespace.ids:
+                    continue
+                fingerprint = namespace.fingerprint(doc)
+                if fingerprint is not None:
+                    if namespace.simhashes.find(fingerprint) is not None or batch.find(fingerprint) is not None:
+                        continue
+                    batch.add(doc.id, fingerprint)
+                new_documents.append(doc)
+                new_embeddings.append(embedding)
+            added = namespace.add(new_documents, new_embeddings)
+        print(f"[session] {session_id}: добавлено чанков {added}, всего {len(namespace.documents)}")
+        return added
+
+    def search(self, session_id, embedding, k, where=None):
+        """Ближайшие чанки сессии (лучшие первыми); пусто, если у сессии нет пространства"""
+        namespace = self._namespace(session_id) if session_id else None
+        if namespace is None:
+            return []
+        with namespace.lock:
+            results = namespace.search(embedding, k, where)
+        # Копии: слияние рангов пишет score в метаданные
+        return [Document(page_content=doc.page_content, metadata=dict(doc.metadata), id=doc.id)
+                for doc, _ in results]
+
+    def collect_garbage(self):
+        """Удаляет пространства, к которым не обращались дольше ttl"""
+        expired_before = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [session_id for session_id, namespace in self._namespaces.items()
+                       if namespace.last_used < expired_before]
+            for session_id in expired:
+                del self._namespaces[session_id]
+        if expired:
+            print(f"[session] Удалено истекших пространств: {len(expired)}")
+        return len(expired)
+
+    def _run(self):
+        while not self._stopping.wait(self.gc_interval):
+            try:
+                self.collect_garbage()
+            except Exception as e:
+                print(f"[session] Garbage collection failed: {e}")
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="session-gc", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._namespaces.clear()
+
+    def stats(self):
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        return {
+            "namespaces": len(namespaces),
+            "chunks": sum(len(namespace.documents) for namespace in namespaces),
+        }
@@ -0,0 +1,91 @@
+# api/summarizer.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db_utils import count_chat_turns, get_chat_turns, get_session_summary, upsert_session_summary
+from langchain_utils import get_summary_chain
+from config import SUMMARY_KEEP_TURNS, SUMMARY_MIN_NEW_TURNS, SUMMARY_MODEL
+
+# Если сводка отстала, дословно отдаем не больше стольких ходов
+MAX_UNSUMMARIZED_TURNS = SUMMARY_KEEP_TURNS * 3
+
+def _format_turns(turns):
+    return "\n".join(f"User: {turn['user_query']}\nAssistant: {turn['gpt_response']}" for turn in turns)
+
+class SessionSummarizer:
+    """Фоново сворачивает старые ходы диалога в сводку, чтобы промпт не рос с длиной сессии"""
+
+    def __init__(self, keep_turns, min_new_turns):
+        self.keep_turns = keep_turns
+        self.min_new_turns = min_new_turns
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-summary")
+        self._pending = set()
+        self._lock = threading.Lock()
+        # Фоновое и синхронное обновление одной сводки не должны идти одновременно
+        self._update_lock = threading.Lock()
+
+    def load_history(self, session_id, model):
+        """История для цепочки: сводка плюс еще не свернутые ходы; второе значение - номер хода.
+
+        Если сводка отстала больше чем на MAX_UNSUMMARIZED_TURNS ходов, она догоняется здесь же,
+        иначе ходы между сводкой и окном выпали бы из контекста.
+        """
+        total = count_chat_turns(session_id)
+        summary = get_session_summary(session_id)
+        summarized = summary["summarized_turns"] if summary else 0
+        if total - summarized > MAX_UNSUMMARIZED_TURNS:
+            print(f"[summary] Session {session_id}: summary is {total - summarized} turns behind, catching up")
+            self._summarize(session_id, SUMMARY_MODEL or model, min_new_turns=1)
+            summary = get_session_summary(session_id)
+            summarized = summary["summarized_turns"] if summary else 0
+        offset = max(summarized, total - MAX_UNSUMMARIZED_TURNS)
+        if offset > summarized:
+            print(f"[summary] Session {session_id}: turns {summarized + 1}-{offset} are missing from the context")
+
+        messages = []
+        if summary and summary["summary"]:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary['summary']}"})
+        for turn in get_chat_turns(session_id, offset=offset):
+            messages.extend([
+                {"role": "human", "content": turn['user_query']},
+                {"role": "ai", "content": turn['gpt_response']}
+            ])
+        return messages, total
+
+    def schedule(self, session_id, model):
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self._executor.submit(self._update, session_id, SUMMARY_MODEL or model)
+
+    def _summarize(self, session_id, model, min_new_turns):
+        """Сворачивает в сводку все ходы, кроме последних keep_turns"""
+        try:
+            with self._update_lock:
+                total = count_chat_turns(session_id)
+                summary = get_session_summary(session_id) or {"summary": "", "summarized_turns": 0}
+                upto = total - self.keep_turns
+                if upto - summary["summarized_turns"] < min_new_turns:
+                    return
+                turns = get_chat_turns(session_id, offset=summary["summarized_turns"],
+                                       limit=upto - summary["summarized_turns"])
+                updated = get_summary_chain(model).invoke({
+                    "summary": summary["summary"] or "(empty)",
+                    "turns": _format_turns(turns)
+                })
+                upsert_session_summary(session_id, updated.strip(), upto)
+                print(f"[summary] Session {session_id}: summarized {upto} of {total} turns")
+        except Exception as e:
+            print(f"[summary] Failed to update summary for {session_id}: {e}")
+
+    def _update(self, session_id, model):
+        try:
+            self._summarize(session_id, model, self.min_new_turns)
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+summarizer = SessionSummarizer(SUMMARY_KEEP_TURNS, SUMMARY_MIN_NEW_TURNS)
@@ -0,0 +1,10 @@
+# api/tests/conftest.py
+# Запуск из корня репозитория: python -m pytest RAG4/api/tests
+import os
+import sys
+import tempfile
+
+# Модули api импортируются плоско, как при запуске сервера из каталога api
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Модули, создающие SQLite-базы при импорте, не должны трогать rag_app.db рабочего каталога
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="rag_tests_"), "rag_app.db"))
@@ -0,0 +1,42 @@
+# api/tests/test_context_packing.py
+from langchain_core.documents import Document
+
+from context_packing import _trim_history, dedupe_chunks, estimate_tokens, pack_context
+
+def _turn(i, words=10):
+    return [{"role": "human", "content": f"question {i} " + "word " * words},
+            {"role": "ai", "content": f"answer {i} " + "word " * words}]
+
+def test_estimate_tokens_counts_words_and_punctuation():
+    assert estimate_tokens("Hello, world!") == 4
+    assert estimate_tokens("") == 0
+
+def test_trim_history_keeps_recent_pairs_and_summary():
+    summary = {"role": "system", "content": "Summary of the earlier conversation: x"}
+    history = [summary] + _turn(1) + _turn(2) + _turn(3)
+    pair_tokens = sum(estimate_tokens(message["content"]) for message in _turn(3))
+    kept, used = _trim_history(history, pair_tokens * 2)
+    assert kept == [summary] + _turn(2) + _turn(3)
+    assert used == pair_tokens * 2 + estimate_tokens(summary["content"])
+
+def test_dedupe_chunks_drops_copies_and_merges_overlaps():
+    text = "".join(f"sentence {i}. " for i in range(40))
+    first, second = text[:300], text[200:]
+    documents = [Document(page_content=first, metadata={"source": "a"}),
+                 Document(page_content=first.upper().lower(), metadata={"source": "a"}),
+                 Document(page_content=second, metadata={"source": "a"}),
+                 Document(page_content=text[100:400], metadata={"source": "b"})]
+    merged = dedupe_chunks(documents)
+    # Перекрытия склеиваются только внутри одного источника
+    assert [doc.page_content for doc in merged] == [text, text[100:400]]
+
+def test_pack_context_stays_within_budget_and_prefers_best_scores():
+    documents = [Document(page_content=f"chunk {i} " + "filler " * 400, metadata={"score": i / 10})
+                 for i in range(10)]
+    inputs = {"input": "question", "chat_history": _turn(1) * 50, "context": documents}
+    packed = pack_context(inputs, "llama3.2", fixed_prompt_tokens=50)
+    history_tokens = sum(estimate_tokens(message["content"]) for message in packed["chat_history"])
+    context_tokens = sum(estimate_tokens(doc.page_content) for doc in packed["context"])
+    assert history_tokens + context_tokens <= 4096 - 1024 - 50 - estimate_tokens("question")
+    assert packed["context"] and packed["context"][0].metadata["score"] == 0.9
+    assert len(packed["chat_history"]) % 2 == 0
@@ -0,0 +1,20 @@
+# api/tests/test_cursor.py
+import pytest
+
+from db_utils import decode_cursor, encode_cursor
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("2026-01-01 10:00:00", "session")) == ["2026-01-01 10:00:00", "session"]
+    assert decode_cursor(encode_cursor("2026-01-01", 42)) == ["2026-01-01", 42]
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    "e30=",                            # {}
+    "WzFd",                            # [1]
+    encode_cursor(1, 2, 3),
+    encode_cursor([1], 2),
+    encode_cursor({"a": 1}, "b"),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
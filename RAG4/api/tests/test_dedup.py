@@ -0,0 +1,34 @@
+# api/tests/test_dedup.py
+import random
+
+from dedup import SimHashIndex, content_hash, hamming_distance, simhash
+
+# Чанк форума обычной длины (text_splitter режет по 1000 символов)
+_WORDS = "install package server worker restart import error module python path virtual environment config".split()
+TEXT = " ".join(random.Random(0).choice(_WORDS) for _ in range(150))
+
+def test_content_hash_ignores_case_and_whitespace():
+    assert content_hash("Hello   World\n") == content_hash("hello world")
+    assert content_hash("hello world") != content_hash("hello there")
+
+def test_simhash_is_deterministic():
+    assert simhash(TEXT) == simhash(TEXT)
+
+def test_near_duplicate_is_found():
+    index = SimHashIndex()
+    index.add("original", simhash(TEXT))
+    # Та же выдача с другой подписью в конце
+    edited = TEXT + " thanks"
+    assert hamming_distance(simhash(TEXT), simhash(edited)) <= index.max_distance
+    assert index.find(simhash(edited)) == "original"
+
+def test_different_text_is_not_a_duplicate():
+    index = SimHashIndex()
+    index.add("original", simhash(TEXT))
+    assert index.find(simhash("Completely unrelated answer about configuring nginx reverse proxies")) is None
+
+def test_find_respects_max_distance():
+    index = SimHashIndex(max_distance=3)
+    index.add("a", 0)
+    assert index.find(0b111) == "a"
+    assert index.find(0b1111) is None
@@ -0,0 +1,72 @@
+# api/tests/test_filters.py
+import json
+import random
+import sqlite3
+from datetime import datetime, timezone
+import pytest
+
+from filters import build_where, matches_where, where_to_sql
+from pydantic_models import RetrievalScope
+
+SITES = ["Stackoverflow", "Reddit", "Habr"]
+
+def _chunks(count=300, seed=0):
+    """Чанки документов и форумов; у части нет created_at, как у старых записей"""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(count):
+        metadata = {"file_id": rng.randint(1, 5)} if i % 2 else {"source": rng.choice(SITES)}
+        if i % 7:
+            metadata["created_at"] = rng.randint(1_000, 2_000)
+        chunks.append((f"chunk-{i}", metadata))
+    return chunks
+
+def _sql_matches(chunks, where):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE chunks (chunk_id TEXT, file_id INTEGER, metadata TEXT)")
+    conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)",
+                     [(chunk_id, metadata.get("file_id"), json.dumps(metadata)) for chunk_id, metadata in chunks])
+    sql, params = where_to_sql(where, columns={"file_id": "file_id"})
+    return {row[0] for row in conn.execute(f"SELECT chunk_id FROM chunks WHERE {sql}", params)}
+
+def _at(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+WHERES = [
+    {"file_id": 3},
+    {"source": {"$ne": "Habr"}},
+    {"file_id": {"$nin": [1, 2]}},
+    {"file_id": {"$in": []}},
+    {"source": {"$nin": []}},
+    {"$or": [{"source": "Reddit"}, {"file_id": {"$gt": 3}}]},
+    {"$and": [{"created_at": {"$gte": 1_200}}, {"created_at": {"$lt": 1_800}}]},
+    build_where(RetrievalScope(sites=["Habr"]), SITES),
+    build_where(RetrievalScope(file_ids=[2, 4]), SITES),
+    build_where(RetrievalScope(sites=["Reddit"], file_ids=[1], created_after=_at(1_500)), SITES),
+    build_where(RetrievalScope(created_before=_at(1_300)), SITES),
+]
+
+@pytest.mark.parametrize("where", WHERES)
+def test_sql_and_python_filters_agree(where):
+    chunks = _chunks()
+    expected = {chunk_id for chunk_id, metadata in chunks if matches_where(metadata, where)}
+    assert _sql_matches(chunks, where) == expected
+
+def test_build_where_without_scope():
+    assert build_where(None, SITES) is None
+    assert build_where(RetrievalScope(), SITES) is None
+
+def test_sites_do_not_restrict_documents():
+    where = build_where(RetrievalScope(sites=["Habr"]), SITES)
+    assert matches_where({"source": "Habr"}, where)
+    assert not matches_where({"source": "Reddit"}, where)
+    assert matches_where({"file_id": 7}, where)
+
+def test_missing_field_does_not_match():
+    assert not matches_where({}, {"created_at": {"$gte": 0}})
+    assert not matches_where({}, {"source": {"$ne": "Habr"}})
+    assert matches_where({}, None)
+
+def test_where_to_sql_rejects_unsafe_field_names():
+    with pytest.raises(ValueError):
+        where_to_sql({"created_at') OR 1 --": 1})
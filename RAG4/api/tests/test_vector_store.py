@@ -0,0 +1,72 @@
+# api/tests/test_vector_store.py
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from vector_store import HnswBackend, QuantizedBackend
+
+DIM = 16
+
+def _vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+def _open(kind, path):
+    if kind == "hnsw":
+        return HnswBackend(str(path), None, m=8, ef_construction=50, ef_search=50)
+    return QuantizedBackend(str(path), None, rescore_factor=4)
+
+def _fill(backend, count=20):
+    ids = [f"chunk-{i}" for i in range(count)]
+    documents = [Document(page_content=f"text {i}", metadata={"file_id": i % 2}) for i in range(count)]
+    vectors = _vectors(count)
+    backend.upsert(ids, vectors, documents)
+    return ids, vectors
+
+@pytest.mark.parametrize("kind", ["hnsw", "quantized"])
+def test_reopen_after_delete(kind, tmp_path):
+    backend = _open(kind, tmp_path)
+    ids, vectors = _fill(backend)
+    backend.persist()
+    assert backend.delete(ids=ids[:3]) == 3
+    backend.persist()
+    # Второе открытие проверяет, что уже удаленные метки не удаляются повторно
+    for _ in range(2):
+        backend = _open(kind, tmp_path)
+        assert backend.count() == len(ids) - 3
+        found = backend.search(vectors[5], 1)
+        assert found[0][0].id == ids[5]
+        assert ids[0] not in {doc.id for doc, _ in backend.search(vectors[0], 5)}
+        backend.persist()
+
+@pytest.mark.parametrize("kind", ["hnsw", "quantized"])
+def test_reopen_after_delete_and_reuse(kind, tmp_path):
+    backend = _open(kind, tmp_path)
+    ids, _ = _fill(backend)
+    backend.delete(ids=ids[:5])
+    backend.persist()
+    backend.upsert(["new"], _vectors(1, seed=1), [Document(page_content="new", metadata={"file_id": 3})])
+    backend.persist()
+    backend = _open(kind, tmp_path)
+    assert backend.count() == len(ids) - 4
+    assert backend.get(where={"file_id": 3})["ids"] == ["new"]
+
+@pytest.mark.parametrize("kind", ["hnsw", "quantized"])
+def test_compact_then_reopen(kind, tmp_path):
+    backend = _open(kind, tmp_path)
+    ids, vectors = _fill(backend)
+    backend.delete(where={"file_id": 0})
+    assert backend.compact() == len(ids) // 2
+    backend = _open(kind, tmp_path)
+    assert sorted(backend.get()["ids"]) == sorted(ids[1::2])
+    assert backend.search(vectors[1], 1)[0][0].id == ids[1]
+
+@pytest.mark.parametrize("kind", ["hnsw", "quantized"])
+def test_unscoped_delete_is_rejected(kind, tmp_path):
+    backend = _open(kind, tmp_path)
+    ids, _ = _fill(backend)
+    with pytest.raises(ValueError):
+        backend.delete()
+    with pytest.raises(ValueError):
+        backend.delete(where={})
+    assert backend.count() == len(ids)
+    assert backend.delete(ids=[]) == 0
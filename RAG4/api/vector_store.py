@@ -0,0 +1,589 @@
+# api/vector_store.py
+"""Основное векторное хранилище за общим интерфейсом: Chroma или индекс внутри процесса"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+import chromadb
+import hnswlib
+import numpy as np
+from langchain_core.documents import Document
+from db_utils import ConnectionPool
+from filters import matches_where
+from quantized_store import QuantizedVectorIndex
+
+# Коллекция, которую создавал langchain_chroma: существующий ./chroma_db читается без переноса.
+# После compact действующая коллекция называется langchain-<суффикс>, ее имя хранится в ACTIVE_COLLECTION_FILE
+CHROMA_COLLECTION = "langchain"
+ACTIVE_COLLECTION_FILE = "active_collection"
+# Размер пачки id в SQLite-запросах in-process хранилищ
+RECORD_BATCH_SIZE = 500
+# Сколько разных where помним вместе с подходящими под них id
+FILTER_CACHE_SIZE = 64
+# Размер пачки при копировании коллекции в compact
+COMPACT_BATCH_SIZE = 1000
+INITIAL_CAPACITY = 1024
+
+class VectorBackend(ABC):
+    """Интерфейс хранилища чанков с векторами.
+
+    get отдает словарь как у Chroma: ids и, если запрошены в include, documents, metadatas
+    и embeddings. search возвращает пары (Document, расстояние), ближайшие первыми.
+    """
+
+    name = None
+    # Запись сразу долговечна и persist ничего не делает
+    persists_on_write = False
+
+    def __init__(self, path, embedding_function):
+        self.path = path
+        self.embedding_function = embedding_function
+
+    def add(self, documents, ids):
+        """Считает эмбеддинги и записывает чанки"""
+        embeddings = self.embedding_function.embed_documents([doc.page_content for doc in documents])
+        self.upsert(ids, embeddings, documents)
+        return ids
+
+    @abstractmethod
+    def upsert(self, ids, embeddings, documents):
+        """Записывает чанки с готовыми векторами; существующие id перезаписываются"""
+
+    @abstractmethod
+    def delete(self, ids=None, where=None):
+        """Удаляет чанки по id и/или where-фильтру; возвращает число удаленных"""
+
+    @abstractmethod
+    def get(self, ids=None, where=None, include=(), limit=None, offset=0):
+        pass
+
+    @abstractmethod
+    def search(self, embedding, k, where=None):
+        pass
+
+    @abstractmethod
+    def count(self):
+        pass
+
+    @abstractmethod
+    def reset(self):
+        """Удаляет все чанки; новые параметры индекса применяются с этого момента"""
+
+    @abstractmethod
+    def compact(self):
+        """Пересобирает индекс без удаленных векторов и с текущими параметрами.
+
+        Новый индекс строится рядом с действующим и подменяет его целиком: поиск все время идет
+        по полному индексу, а падение на любом шаге оставляет старый или новый индекс, но не пустой.
+        Пока идет compact, в хранилище не пишут. Возвращает число векторов.
+        """
+
+    def persist(self):
+        """Сбрасывает индекс на диск; Chroma пишет сама, in-process хранилища - по этому вызову"""
+
+    def size_bytes(self):
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                total += os.path.getsize(os.path.join(root, name))
+        return total
+
+    def stats(self):
+        return {"backend": self.name, "vectors": self.count(), "bytes": self.size_bytes()}
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+    persists_on_write = True
+
+    def __init__(self, path, embedding_function, m, ef_construction, ef_search):
+        super().__init__(path, embedding_function)
+        self.ef_search = ef_search
+        self.configuration = {"hnsw": {"max_neighbors": m, "ef_construction": ef_construction, "ef_search": ef_search}}
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection_name = self._active_name()
+        self.collection = self._open(self.collection_name)
+        self._drop_stale_collections()
+
+    def _active_name(self):
+        pointer = os.path.join(self.path, ACTIVE_COLLECTION_FILE)
+        if os.path.exists(pointer):
+            with open(pointer, encoding="utf-8") as f:
+                return f.read().strip()
+        return CHROMA_COLLECTION
+
+    def _set_active_name(self, name):
+        pointer = os.path.join(self.path, ACTIVE_COLLECTION_FILE)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer + ".tmp", pointer)
+
+    def _drop_stale_collections(self):
+        """Удаляет коллекции, оставшиеся от прерванного compact: недостроенную новую или не удаленную старую"""
+        dropped = False
+        for collection in self.client.list_collections():
+            name = collection.name
+            if name != self.collection_name and (name == CHROMA_COLLECTION or name.startswith(CHROMA_COLLECTION + "-")):
+                self.client.delete_collection(name)
+                print(f"Dropped stale collection {name}")
+                dropped = True
+        if dropped:
+            self._remove_orphaned_segments()
+
+    def _open(self, name):
+        collection = self.client.get_or_create_collection(name, embedding_function=None,
+                                                          configuration=self.configuration)
+        # У существующей коллекции конфигурация не меняется, кроме ef_search
+        hnsw = (collection.configuration or {}).get("hnsw") or {}
+        if hnsw.get("ef_search") not in (None, self.ef_search):
+            collection.modify(configuration={"hnsw": {"ef_search": self.ef_search}})
+        return collection
+
+    def upsert(self, ids, embeddings, documents):
+        if not ids:
+            return
+        # Chroma не принимает пустые метаданные
+        self.collection.upsert(ids=ids, embeddings=np.asarray(embeddings, dtype=np.float32),
+                               documents=[doc.page_content for doc in documents],
+                               metadatas=[doc.metadata or None for doc in documents])
+
+    def delete(self, ids=None, where=None):
+        if ids is not None and not ids:
+            return 0
+        result = self.collection.delete(ids=ids, where=where)
+        return result["deleted"]
+
+    def get(self, ids=None, where=None, include=(), limit=None, offset=0):
+        return self.collection.get(ids=ids, where=where, include=list(include), limit=limit, offset=offset or None)
+
+    def search(self, embedding, k, where=None):
+        result = self.collection.query(query_embeddings=[np.asarray(embedding, dtype=np.float32)], n_results=k,
+                                       where=where or None, include=["documents", "metadatas", "distances"])
+        return [(Document(page_content=text, metadata=metadata or {}, id=chunk_id), distance)
+                for chunk_id, text, metadata, distance in zip(result["ids"][0], result["documents"][0],
+                                                               result["metadatas"][0], result["distances"][0])]
+
+    def count(self):
+        return self.collection.count()
+
+    def reset(self):
+        self.client.delete_collection(self.collection_name)
+        self.collection = self._open(self.collection_name)
+        self._remove_orphaned_segments()
+
+    def compact(self):
+        name = f"{CHROMA_COLLECTION}-{uuid.uuid4().hex[:12]}"
+        target = self.client.create_collection(name, embedding_function=None, configuration=self.configuration)
+        try:
+            offset = 0
+            while True:
+                batch = self.collection.get(include=["documents", "metadatas", "embeddings"],
+                                            limit=COMPACT_BATCH_SIZE, offset=offset or None)
+                if not batch["ids"]:
+                    break
+                target.add(ids=batch["ids"], embeddings=batch["embeddings"], documents=batch["documents"],
+                           metadatas=batch["metadatas"])
+                offset += len(batch["ids"])
+        except Exception:
+            self.client.delete_collection(name)
+            raise
+        # Точка переключения: после записи указателя при открытии берется новая коллекция
+        previous = self.collection_name
+        self._set_active_name(name)
+        self.collection_name, self.collection = name, target
+        self.client.delete_collection(previous)
+        self._remove_orphaned_segments()
+        return target.count()
+
+    def _remove_orphaned_segments(self):
+        """Chroma оставляет на диске HNSW-файлы удаленной коллекции; убираем каталоги сегментов,
+        которых больше нет в ее каталоге chroma.sqlite3"""
+        catalog = sqlite3.connect(os.path.join(self.path, "chroma.sqlite3"))
+        try:
+            live = {row[0] for row in catalog.execute("SELECT id FROM segments")}
+        finally:
+            catalog.close()
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if os.path.isdir(path) and name not in live and os.path.exists(os.path.join(path, "header.bin")):
+                shutil.rmtree(path)
+                print(f"Removed orphaned HNSW segment {name}")
+
+class InProcessBackend(VectorBackend):
+    """Тексты и метаданные в SQLite (records.db), векторы в индексе подкласса.
+
+    Записи в SQLite фиксируются сразу, индекс - по persist. При открытии записи без вектора
+    (не дожившие до persist) отбрасываются, а векторы без записи удаляются из индекса.
+    """
+
+    def __init__(self, path, embedding_function):
+        super().__init__(path, embedding_function)
+        os.makedirs(path, exist_ok=True)
+        self.records = ConnectionPool(os.path.join(path, "records.db"), 2)
+        self._lock = threading.RLock()
+        self._dirty = False
+        # Счетчик записей: compact по нему видит, что индекс менялся, пока строился новый
+        self._writes = 0
+        # where -> подходящие id; сбрасывается при каждой записи
+        self._filter_cache = {}
+        with self.records.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS records
+                            (id INTEGER PRIMARY KEY,
+                             chunk_id TEXT UNIQUE,
+                             document TEXT,
+                             metadata TEXT)''')
+            conn.commit()
+            # Метаданные держим в памяти: по ним фильтруется каждый поиск с where
+            self._metadata = {row["chunk_id"]: json.loads(row["metadata"])
+                              for row in conn.execute('SELECT chunk_id, metadata FROM records ORDER BY id')}
+        self._reconcile()
+
+    def _reconcile(self):
+        stored = self._vector_ids()
+        lost = [chunk_id for chunk_id in self._metadata if chunk_id not in stored]
+        orphaned = [chunk_id for chunk_id in stored if chunk_id not in self._metadata]
+        if lost:
+            self._delete_records(lost)
+            print(f"[{self.name}] Отброшено записей без вектора: {len(lost)}")
+        if orphaned:
+            self._delete_vectors(orphaned)
+            self._dirty = True
+
+    @abstractmethod
+    def _vector_ids(self):
+        pass
+
+    @abstractmethod
+    def _write_vectors(self, ids, embeddings):
+        pass
+
+    @abstractmethod
+    def _delete_vectors(self, ids):
+        pass
+
+    @abstractmethod
+    def _read_vectors(self, ids):
+        """id -> вектор для найденных id"""
+
+    @abstractmethod
+    def _search_vectors(self, embedding, k, allowed_ids):
+        """[(id, расстояние)] ближайшие первыми; allowed_ids=None - без ограничения"""
+
+    @abstractmethod
+    def _reset_vectors(self):
+        pass
+
+    @abstractmethod
+    def _persist_vectors(self):
+        pass
+
+    def _delete_records(self, ids):
+        with self.records.connection() as conn:
+            conn.executemany('DELETE FROM records WHERE chunk_id = ?', [(chunk_id,) for chunk_id in ids])
+            conn.commit()
+        for chunk_id in ids:
+            self._metadata.pop(chunk_id, None)
+        self._filter_cache.clear()
+
+    def _read_documents(self, ids):
+        texts = {}
+        with self.records.connection() as conn:
+            for start in range(0, len(ids), RECORD_BATCH_SIZE):
+                batch = ids[start:start + RECORD_BATCH_SIZE]
+                rows = conn.execute(f'SELECT chunk_id, document FROM records WHERE chunk_id IN ({",".join("?" * len(batch))})',
+                                    batch)
+                texts.update((row["chunk_id"], row["document"]) for row in rows)
+        return texts
+
+    def _allowed(self, where):
+        key = json.dumps(where, sort_keys=True)
+        allowed = self._filter_cache.get(key)
+        if allowed is None:
+            if len(self._filter_cache) >= FILTER_CACHE_SIZE:
+                self._filter_cache.clear()
+            allowed = self._filter_cache[key] = self._matching(where)
+        return allowed
+
+    def _matching(self, where, ids=None):
+        candidates = self._metadata if ids is None else [chunk_id for chunk_id in ids if chunk_id in self._metadata]
+        if not where:
+            return list(candidates)
+        return [chunk_id for chunk_id in candidates if matches_where(self._metadata[chunk_id], where)]
+
+    def upsert(self, ids, embeddings, documents):
+        if not ids:
+            return
+        rows = [(chunk_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                for chunk_id, doc in zip(ids, documents)]
+        with self._lock:
+            self._write_vectors(ids, np.asarray(embeddings, dtype=np.float32))
+            with self.records.connection() as conn:
+                conn.executemany('''INSERT INTO records (chunk_id, document, metadata) VALUES (?, ?, ?)
+                                    ON CONFLICT (chunk_id) DO UPDATE SET document = excluded.document,
+                                                                         metadata = excluded.metadata''', rows)
+                conn.commit()
+            for chunk_id, doc in zip(ids, documents):
+                self._metadata[chunk_id] = dict(doc.metadata)
+            self._filter_cache.clear()
+            self._writes += 1
+            self._dirty = True
+
+    def delete(self, ids=None, where=None):
+        # Как и Chroma, не удаляем все хранилище по пустому запросу; для этого есть reset
+        if ids is None and not where:
+            raise ValueError("delete requires ids or where")
+        with self._lock:
+            targets = self._matching(where, ids)
+            if targets:
+                self._delete_vectors(targets)
+                self._delete_records(targets)
+                self._writes += 1
+                self._dirty = True
+            return len(targets)
+
+    def get(self, ids=None, where=None, include=(), limit=None, offset=0):
+        with self._lock:
+            selected = self._matching(where, ids)
+            selected = selected[offset or 0:][:limit] if limit is not None else selected[offset or 0:]
+            result = {"ids": selected}
+            if "metadatas" in include:
+                result["metadatas"] = [dict(self._metadata[chunk_id]) for chunk_id in selected]
+            if "documents" in include:
+                texts = self._read_documents(selected)
+                result["documents"] = [texts[chunk_id] for chunk_id in selected]
+            if "embeddings" in include:
+                vectors = self._read_vectors(selected)
+                result["embeddings"] = [vectors[chunk_id] for chunk_id in selected]
+            return result
+
+    def search(self, embedding, k, where=None):
+        with self._lock:
+            allowed = self._allowed(where) if where else None
+            found = self._search_vectors(np.asarray(embedding, dtype=np.float32), k, allowed)
+            texts = self._read_documents([chunk_id for chunk_id, _ in found])
+            return [(Document(page_content=texts[chunk_id], metadata=dict(self._metadata[chunk_id]), id=chunk_id),
+                     distance) for chunk_id, distance in found]
+
+    def count(self):
+        return len(self._metadata)
+
+    def reset(self):
+        with self._lock:
+            self._reset_vectors()
+            with self.records.connection() as conn:
+                conn.execute('DELETE FROM records')
+                conn.commit()
+            self._metadata = {}
+            self._filter_cache.clear()
+            self._dirty = True
+
+    def persist(self):
+        with self._lock:
+            if self._dirty:
+                self._persist_vectors()
+                self._dirty = False
+
+class HnswBackend(InProcessBackend):
+    """HNSW-граф hnswlib в памяти процесса; место удаленных векторов занимают новые"""
+
+    name = "hnsw"
+
+    def __init__(self, path, embedding_function, m, ef_construction, ef_search):
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+        self.labels = {}
+        self.ids = {}
+        self.next_label = 0
+        index_path = os.path.join(path, "index.bin")
+        state_path = os.path.join(path, "state.json")
+        if os.path.exists(index_path) and os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.index = hnswlib.Index(space="cosine", dim=state["dim"])
+            self.index.load_index(index_path, allow_replace_deleted=True)
+            live = set(self.index.get_ids_list())
+            self.labels = {chunk_id: label for chunk_id, label in state["labels"].items() if label in live}
+            self.ids = {label: chunk_id for chunk_id, label in self.labels.items()}
+            # Граф сохраняется раньше состояния: векторы, не попавшие в state.json, ничьи.
+            # get_ids_list отдает и уже удаленные метки, их пропускаем
+            for label in live - set(self.ids) - set(state.get("deleted", [])):
+                try:
+                    self.index.mark_deleted(label)
+                except RuntimeError:
+                    pass
+            self.next_label = state["next_label"]
+            self.index.set_ef(ef_search)
+        super().__init__(path, embedding_function)
+
+    def _vector_ids(self):
+        return set(self.labels)
+
+    def _create(self, dim):
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        self.index.init_index(max_elements=INITIAL_CAPACITY, M=self.m, ef_construction=self.ef_construction,
+                              allow_replace_deleted=True)
+        self.index.set_ef(self.ef_search)
+
+    def _write_vectors(self, ids, embeddings):
+        if self.index is None:
+            self._create(embeddings.shape[1])
+        # Помеченные удаленными слоты переиспользуются, расти нужно только на остаток
+        used = self.index.get_current_count()
+        new = len({chunk_id for chunk_id in ids if chunk_id not in self.labels})
+        needed = used + max(0, new - (used - len(self.labels)))
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(max(needed, self.index.get_max_elements() * 2))
+        labels = []
+        for chunk_id in ids:
+            label = self.labels.get(chunk_id)
+            if label is None:
+                label = self.labels[chunk_id] = self.next_label
+                self.ids[label] = chunk_id
+                self.next_label += 1
+            labels.append(label)
+        self.index.add_items(embeddings, np.asarray(labels), replace_deleted=True)
+
+    def _delete_vectors(self, ids):
+        for chunk_id in ids:
+            label = self.labels.pop(chunk_id, None)
+            if label is not None:
+                del self.ids[label]
+                self.index.mark_deleted(label)
+
+    def _read_vectors(self, ids):
+        found = [chunk_id for chunk_id in ids if chunk_id in self.labels]
+        if not found:
+            return {}
+        vectors = self.index.get_items([self.labels[chunk_id] for chunk_id in found], return_type="numpy")
+        return dict(zip(found, vectors))
+
+    def _exact_search(self, embedding, k, ids):
+        vectors = np.asarray(self.index.get_items([self.labels[chunk_id] for chunk_id in ids], return_type="numpy"))
+        distances = 1.0 - vectors @ (embedding / (np.linalg.norm(embedding) or 1.0))
+        best = np.argsort(distances)[:k]
+        return [(ids[i], float(distances[i])) for i in best]
+
+    def _search_vectors(self, embedding, k, allowed_ids):
+        if self.index is None:
+            return []
+        if allowed_ids is not None:
+            # Узкий фильтр отсекает почти весь граф: точный перебор разрешенных и быстрее, и полнее
+            if len(allowed_ids) <= max(self.ef_search, k) * 4:
+                return self._exact_search(embedding, k, allowed_ids) if allowed_ids else []
+            allowed = {self.labels[chunk_id] for chunk_id in allowed_ids}
+            label_filter = allowed.__contains__
+        else:
+            label_filter = None
+        k = min(k, len(self.labels) if allowed_ids is None else len(allowed_ids))
+        if k == 0:
+            return []
+        try:
+            labels, distances = self.index.knn_query(embedding, k=k, filter=label_filter)
+        except RuntimeError:
+            # hnswlib не набрал k результатов (мало связей вокруг разрешенных узлов)
+            return self._exact_search(embedding, k, allowed_ids if allowed_ids is not None else list(self.labels))
+        return [(self.ids[label], float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+    def _reset_vectors(self):
+        self.index = None
+        self.labels = {}
+        self.ids = {}
+        self.next_label = 0
+        for name in ("index.bin", "state.json"):
+            if os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+
+    def _save_index(self, index):
+        index.save_index(os.path.join(self.path, "index.bin.tmp"))
+        os.replace(os.path.join(self.path, "index.bin.tmp"), os.path.join(self.path, "index.bin"))
+
+    def _persist_vectors(self):
+        if self.index is None:
+            return
+        # Сначала граф, потом состояние: id без вектора при открытии отбросятся
+        self._save_index(self.index)
+        self._write_state()
+
+    def compact(self):
+        while True:
+            with self._lock:
+                if self.index is None:
+                    return 0
+                writes = self._writes
+                labels = list(self.labels.values())
+                vectors = self.index.get_items(labels, return_type="numpy") if labels else None
+                dim = self.index.dim
+            # Новый граф строится без блокировки, поиск пока идет по старому. Метки те же,
+            # поэтому state.json подходит к обоим графам
+            index = hnswlib.Index(space="cosine", dim=dim)
+            index.init_index(max_elements=max(len(labels), INITIAL_CAPACITY), M=self.m,
+                             ef_construction=self.ef_construction, allow_replace_deleted=True)
+            if labels:
+                index.add_items(vectors, np.asarray(labels))
+            index.set_ef(self.ef_search)
+            with self._lock:
+                if self._writes != writes:
+                    continue
+                self._save_index(index)
+                self.index = index
+                self._write_state()
+                self._dirty = False
+                return len(labels)
+
+    def _write_state(self):
+        # Метки, помеченные удаленными в графе: при открытии их не нужно удалять повторно
+        deleted = sorted(set(self.index.get_ids_list()) - set(self.ids))
+        state = {"dim": self.index.dim, "next_label": self.next_label, "labels": self.labels, "deleted": deleted}
+        with open(os.path.join(self.path, "state.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(os.path.join(self.path, "state.json.tmp"), os.path.join(self.path, "state.json"))
+
+class QuantizedBackend(InProcessBackend):
+    """int8-коды с точным пересчетом кандидатов (quantized_store): в разы меньше памяти, чем HNSW"""
+
+    name = "quantized"
+
+    def __init__(self, path, embedding_function, rescore_factor):
+        self.index = QuantizedVectorIndex(os.path.join(path, "vectors"), rescore_factor=rescore_factor)
+        super().__init__(path, embedding_function)
+
+    def _vector_ids(self):
+        return set(self.index.labels)
+
+    def _write_vectors(self, ids, embeddings):
+        self.index.add(ids, embeddings)
+
+    def _delete_vectors(self, ids):
+        self.index.delete(ids)
+
+    def _read_vectors(self, ids):
+        return self.index.get_vectors(ids)
+
+    def _search_vectors(self, embedding, k, allowed_ids):
+        return [(chunk_id, 1.0 - score) for chunk_id, score in self.index.search(embedding, k, allowed_ids)]
+
+    def _reset_vectors(self):
+        self.index.reset()
+
+    def _persist_vectors(self):
+        self.index.persist()
+
+    def compact(self):
+        with self._lock:
+            # Индекс пишет новое поколение файлов и переключается на него вместе с state.json
+            self.index.compact()
+            self._dirty = False
+            return self.count()
+
+def create_backend(name, path, embedding_function, m, ef_construction, ef_search, rescore_factor):
+    if name == "chroma":
+        return ChromaBackend(path, embedding_function, m, ef_construction, ef_search)
+    if name == "hnsw":
+        return HnswBackend(path, embedding_function, m, ef_construction, ef_search)
+    if name == "quantized":
+        return QuantizedBackend(path, embedding_function, rescore_factor)
+    raise ValueError(f"Unknown vector backend: {name}")
@@ -1,7 +1,9 @@
 import requests
 import streamlit as st
+import json
+import time
 
-def get_api_response(question, session_id, model):
+def get_api_response(question, session_id, model, on_token=None):
     headers = {
         'accept': 'application/json',
         'Content-Type': 'application/json'
@@ -15,30 +17,66 @@ def get_api_response(question, session_id, model):
     selected_sites = st.session_state.get("selected_sites", [])
     if selected_sites:
         data["selected_sites"] = selected_sites
+        # Ищем только по выбранным форумам (загруженные документы остаются в поиске)
+        data["scope"] = {"sites": selected_sites}
     
     try:
         print(selected_sites)
         if selected_sites:
-            forums_search(headers=headers, data=data)
+            # Результаты форумов живут в пространстве сессии: новый чат получает session_id от поиска
+            search_result = forums_search(headers=headers, data=data)
+            if search_result and search_result.get("session_id"):
+                data["session_id"] = search_result["session_id"]
         else:
             print(f"Not searching forums")
 
-        response = requests.post("http://localhost:8000/chat", headers=headers, json=data)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"API request failed with status code {response.status_code}: {response.text}")
-            return None
+        return stream_chat_response(headers=headers, data=data, on_token=on_token)
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
         return None
 
+def stream_chat_response(headers, data, on_token=None):
+    started = time.perf_counter()
+    first_token_at = None
+    answer = ""
+    result = None
+
+    with requests.post("http://localhost:8000/chat/stream", headers=headers, json=data, stream=True) as response:
+        if response.status_code != 200:
+            st.error(f"API request failed with status code {response.status_code}: {response.text}")
+            return None
+
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "start":
+                result = {"session_id": event["session_id"], "model": event["model"]}
+            elif event["type"] == "token":
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    print(f"Time to first token: {first_token_at - started:.3f}s")
+                answer += event["content"]
+                if on_token:
+                    on_token(answer)
+            elif event["type"] == "done":
+                result = {"answer": event["answer"], "session_id": event["session_id"], "model": event["model"]}
+            elif event["type"] == "error":
+                st.error(f"API request failed: {event['detail']}")
+                return None
+
+    print(f"Total response time: {time.perf_counter() - started:.3f}s")
+    if result is None or "answer" not in result:
+        st.error("API stream ended before the answer was complete")
+        return None
+    return result
+
 def forums_search(headers, data):
     print("Parsing forums..." + data["question"])
     try:
         response = requests.post("http://localhost:8000/forums-search", headers=headers, json=data)
         if response.status_code == 200:
-            return True
+            return response.json()
         else:
             st.error(f"Failed to search forums: {response.status_code} - {response.text}")
             return None
@@ -60,6 +98,18 @@ def upload_document(file):
         st.error(f"An error occurred while uploading the file: {str(e)}")
         return None
 
+def get_job_status(job_id):
+    try:
+        response = requests.get(f"http://localhost:8000/jobs/{job_id}")
+        if response.status_code == 200:
+            return response.json()
+        else:
+            st.error(f"Failed to fetch job status. Error: {response.status_code} - {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"An error occurred while fetching job status: {str(e)}")
+        return None
+
 def list_documents():
     try:
         response = requests.get("http://localhost:8000/list-docs")
@@ -89,29 +139,37 @@ def delete_document(file_id):
         st.error(f"An error occurred while deleting the document: {str(e)}")
         return None
 
-def get_chat_sessions():
+def get_chat_sessions(cursor=None, limit=20):
+    """Одна страница списка чатов: {"sessions": [...], "next_cursor": ...}"""
     try:
-        response = requests.get("http://localhost:8000/chat-sessions")
+        params = {'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        response = requests.get("http://localhost:8000/chat-sessions", params)
         if response.status_code == 200:
             return response.json()
         else:
             st.error(f"Failed to fetch chat sessions. Error: {response.status_code} - {response.text}")
-            return []
+            return {"sessions": [], "next_cursor": None}
     except Exception as e:
         st.error(f"An error occurred while fetching chat sessions: {str(e)}")
-        return []
+        return {"sessions": [], "next_cursor": None}
 
-def get_chat_history(session_id):
+def get_chat_history(session_id, cursor=None, limit=20):
+    """Последние limit ходов чата до cursor: {"messages": [...], "next_cursor": ...}"""
     try:
         head = {
-            'session_id': session_id
+            'session_id': session_id,
+            'limit': limit
         }
+        if cursor:
+            head['cursor'] = cursor
         response = requests.get(f"http://localhost:8000/chat-history", head)
         if response.status_code == 200:
             return response.json()
         else:
             st.error(f"Failed to fetch chat history. Error: {response.status_code} - {response.text}")
-            return []
+            return {"messages": [], "next_cursor": None}
     except Exception as e:
         st.error(f"An error occurred while fetching chat history: {str(e)}")
-        return []
+        return {"messages": [], "next_cursor": None}
@@ -2,14 +2,14 @@ import streamlit as st
 from api_utils import get_api_response, get_chat_history
 import time
 
-def load_chat_history(session_id):
-    chat_history = get_chat_history(session_id)
-    if chat_history:
-        return [
-            {"role": "U" if msg["role"] == "human" else "assistant", "content": msg["content"]}
-            for msg in chat_history
-        ]
-    return []
+def load_chat_history(session_id, cursor=None):
+    """Страница истории в формате сообщений интерфейса и курсор на более ранние ходы"""
+    page = get_chat_history(session_id, cursor)
+    messages = [
+        {"role": "U" if msg["role"] == "human" else "assistant", "content": msg["content"]}
+        for msg in page["messages"]
+    ]
+    return messages, page["next_cursor"]
 
 def display_chat_interface():
     st.markdown("""
@@ -180,10 +180,16 @@ def display_chat_interface():
 
     if "show_chat_history" in st.session_state and st.session_state.show_chat_history:
         session_id = st.session_state.session_id
-        if session_id and "chat_history_loaded" not in st.session_state:
+        # История загружается один раз при выборе чата; новые ответы дописываются локально
+        if session_id and st.session_state.get("history_session_id") != session_id:
             with st.spinner("Загрузка истории чата..."):
-                st.session_state.messages = load_chat_history(session_id)
-                st.session_state.chat_history_loaded = True
+                st.session_state.messages, st.session_state.history_cursor = load_chat_history(session_id)
+                st.session_state.history_session_id = session_id
+
+        if st.session_state.get("history_cursor") and st.button("Показать более ранние сообщения"):
+            with st.spinner("Загрузка истории чата..."):
+                earlier, st.session_state.history_cursor = load_chat_history(session_id, st.session_state.history_cursor)
+                st.session_state.messages = earlier + st.session_state.messages
 
     for message in st.session_state.messages:
         role_class = "user-message" if message["role"] == "U" else "assistant-message"
@@ -207,8 +213,19 @@ def display_chat_interface():
             </div>
             """, unsafe_allow_html=True)
 
+            def render_partial_answer(answer):
+                st.markdown(
+                    f"<div class='chat-container'><div class='chat-bubble assistant-message'>{answer}</div></div>",
+                    unsafe_allow_html=True
+                )
+
             time.sleep(0.3)
-            response = get_api_response(prompt, st.session_state.session_id, st.session_state.model)
+            response = get_api_response(
+                prompt,
+                st.session_state.session_id,
+                st.session_state.model,
+                on_token=render_partial_answer
+            )
             st.empty()
 
             if response:
@@ -234,5 +251,3 @@ def display_chat_interface():
             else:
                 st.error("Не удалось получить ответ от API. Попробуйте снова.")
 
-    if "chat_history_loaded" in st.session_state and st.session_state.show_chat_history:
-        del st.session_state.chat_history_loaded
@@ -1,5 +1,33 @@
 import streamlit as st
-from api_utils import upload_document, list_documents, delete_document, get_chat_sessions
+from api_utils import upload_document, list_documents, delete_document, get_chat_sessions, get_job_status
+
+# Как часто фрагмент прогресса опрашивает /jobs/{id}, секунды
+UPLOAD_POLL_SECONDS = 1
+
+def _finish_upload(level, message):
+    """Убирает прогресс и перезапускает страницу; сообщение покажется уже без фрагмента"""
+    st.session_state.upload_job_id = None
+    st.session_state.upload_message = (level, message)
+    st.rerun()
+
+@st.fragment(run_every=UPLOAD_POLL_SECONDS)
+def display_upload_progress(job_id):
+    """Опрашивает /jobs/{id}: фрагмент перерисовывается сам, остальной интерфейс не ждет индексации"""
+    job = get_job_status(job_id)
+    if job is None:
+        _finish_upload("error", "Не удалось получить статус индексации.")
+    if job["status"] == "done":
+        st.session_state.documents = list_documents()
+        _finish_upload("success", f"Файл **{job['filename']}** загружен. ID: `{job['file_id']}`")
+    if job["status"] == "failed":
+        _finish_upload("error", f"Ошибка при индексации файла **{job['filename']}**: {job['error']}")
+    if job["chunks_total"]:
+        st.progress(
+            job["chunks_embedded"] / job["chunks_total"],
+            text=f"Страниц: {job['pages_parsed']}, чанков: {job['chunks_embedded']} из {job['chunks_total']}"
+        )
+    else:
+        st.progress(0.0, text="В очереди на индексацию...")
 
 def display_sidebar():
     with st.sidebar:
@@ -47,37 +75,41 @@ def display_sidebar():
         if st.button("Создать новый чат"):
             print("Новый разговор")
             st.session_state.session_id = None
+            st.session_state.history_session_id = None
             st.session_state.show_chat_history = False
             st.session_state.show_chat_selector = False  
             st.session_state.messages = []
 
         if st.button("Выбрать чат"):
-            chat_sessions = get_chat_sessions()
-            if chat_sessions:
+            # Загружаем только первую страницу; следующие подгружаются по кнопке
+            page = get_chat_sessions()
+            if page["sessions"]:
                 st.session_state.show_chat_selector = True
-                st.session_state.chat_sessions = chat_sessions  
+                st.session_state.chat_sessions = page["sessions"]
+                st.session_state.chat_sessions_cursor = page["next_cursor"]
             else:
                 st.write("История чатов пуста или не удалось загрузить.")
 
         if st.session_state.show_chat_selector:
             chat_sessions = st.session_state.chat_sessions
-            session_titles = [session["title"] for session in chat_sessions]
-            selected_session_title = st.selectbox(
+            titles = {session["session_id"]: session["title"] for session in chat_sessions}
+            selected_session_id = st.selectbox(
                 "Выберите чат",
-                options=session_titles,
+                options=list(titles),
+                format_func=lambda session_id: titles[session_id],
                 help="Выберите прошлый чат для просмотра",
                 key="chat_selector"
             )
-            if selected_session_title:
-                print(f"Выбранный заголовок: {selected_session_title}")
-                selected_session = next(
-                    (session for session in chat_sessions if session["title"] == selected_session_title),
-                    None
-                )
-                if selected_session:
-                    st.session_state.session_id = selected_session["session_id"]
-                    st.session_state.show_chat_history = True 
-                    print(f"Установлен session_id: {st.session_state.session_id}")
+            if st.session_state.get("chat_sessions_cursor") and st.button("Загрузить еще чаты"):
+                page = get_chat_sessions(st.session_state.chat_sessions_cursor)
+                st.session_state.chat_sessions = chat_sessions + page["sessions"]
+                st.session_state.chat_sessions_cursor = page["next_cursor"]
+                st.rerun()
+            if selected_session_id:
+                print(f"Выбранный заголовок: {titles[selected_session_id]}")
+                st.session_state.session_id = selected_session_id
+                st.session_state.show_chat_history = True 
+                print(f"Установлен session_id: {st.session_state.session_id}")
 
         st.markdown("---")
         st.markdown("<h1 style='color: #3a7bd5;'>Загрузка документов</h1>", unsafe_allow_html=True)
@@ -87,11 +119,19 @@ def display_sidebar():
             if st.button("Загрузить файл"):
                 with st.spinner("Загрузка..."):
                     upload_response = upload_document(uploaded_file)
-                    if upload_response:
-                        st.success(f"Файл **{uploaded_file.name}** загружен. ID: `{upload_response['file_id']}`")
-                        st.session_state.documents = list_documents()
-                    else:
-                        st.error("Ошибка при загрузке файла.")
+                if upload_response and upload_response.get("duplicate"):
+                    st.info(f"Этот файл уже загружен. ID: `{upload_response['file_id']}`")
+                    st.session_state.upload_job_id = upload_response["job_id"]
+                elif upload_response and "job_id" in upload_response:
+                    st.session_state.upload_job_id = upload_response["job_id"]
+                else:
+                    st.error("Ошибка при загрузке файла.")
+
+        if st.session_state.get("upload_job_id"):
+            display_upload_progress(st.session_state.upload_job_id)
+        if st.session_state.get("upload_message"):
+            level, message = st.session_state.pop("upload_message")
+            getattr(st, level)(message)
 
         st.markdown("<h1 style='color: #3a7bd5;'>Загруженные документы</h1>", unsafe_allow_html=True)
 